@@ -1,8 +1,39 @@
+import json
 import os
 import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
 
 from validator import topological_sort, ValidationError, _canonical_type
 
+# normalized node_defs entry for unknown types: (inputs, lib, outputs)
+_EMPTY_DEF = ((), None, ())
+
+# C++ string literal escapes
+_ESCAPE_TABLE = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\t': '\\t'})
+
+# identifier sanitization pattern, compiled once rather than per node
+_SANITIZE_RE = re.compile(r'[^0-9a-zA-Z_]')
+
+
+class _Scope:
+    """Emission state for one graph: the main graph (function=None) or a function body."""
+
+    def __init__(self, function: Optional[str], var_names: Dict[str, str], make_var,
+                 incoming_map: Optional[Dict[str, Dict[str, str]]] = None,
+                 incoming_list: Optional[Dict[str, List[str]]] = None):
+        self.function = function
+        self.var_names = var_names
+        self.make_var = make_var
+        self.incoming_map = incoming_map
+        self.incoming_list = incoming_list
+        self._get_var = var_names.get
+
+    def resolve(self, src: Optional[str]) -> str:
+        # C++ expression for an input source: its variable name, the raw id if unnamed, or '0' if unconnected
+        v = self._get_var(src)
+        return v if v is not None else (src or '0')
+
 
 class CppEmitter:
     TYPE_MAP = {
@@ -13,46 +44,91 @@ class CppEmitter:
         'bool': 'bool',
         'any': 'auto'
     }
+    BINOP_OPS = {'Add': '+', 'Sub': '-', 'Mul': '*', 'Div': '/'}
+    # constant fragments shared by every emitted line; emit_line_with_fragments only reads them
+    _COMMA_FRAG = {'text': ', '}
+    _SEMI_FRAG = {'text': ';'}
+    _CLOSE_CALL_FRAG = {'text': ');'}
 
     def __init__(self, ir: Dict[str, Any], node_defs: Dict[str, Any] = None):
         self.ir = ir
         self.node_defs = node_defs or {}
+        # node type -> (inputs, lib, outputs), normalized once so handlers do a single lookup per node
+        self._defs_norm = {
+            t: (d.get('inputs') or (), d.get('lib'), d.get('outputs') or ())
+            for t, d in self.node_defs.items()
+        }
         self.includes = set(ir.get("imports", []))
         self.code_lines: List[str] = []
+        self._line_no = 0  # number of lines emitted so far; kept in step with code_lines by the emit_line* writers
+        self._indent_prefix_cache: Dict[int, str] = {}  # indent level -> prefix string
         self.indent_level = 0
         self.var_names: Dict[str, str] = {}  # node id -> C++ variable name
         self._used_names: Dict[str, int] = {}
         self.mapping: List[Dict[str, Any]] = []  # {node_id, function?, start_line, end_line, start_col?, end_col?, port?}
-        self._port_mappings: List[Dict[str, Any]] = []  # fallback port mapping entries if immediate resolution fails
+        self.mapping_by_node: Dict[str, List[Dict[str, Any]]] = {}  # node id -> its entries in self.mapping (same dicts)
+        self._cast_target_cache: Dict[str, tuple] = {}  # Cast targetType -> (canonical type, C++ type)
 
         # Build incoming edge maps: for each destination node, map toPort->fromNode; also keep positional list
-        self.incoming_by_node: Dict[str, Dict[str, str]] = {}
-        self.incoming_list_by_node: Dict[str, List[str]] = {}
-        edges = ir.get('edges', []) or []
-        for e in edges:
-            frm = e.get('from')
+        incoming: Dict[str, Dict[str, str]] = defaultdict(dict)
+        positional: Dict[str, List[str]] = defaultdict(list)
+        for e in ir.get('edges') or []:
             to = e.get('to')
+            by_port = incoming[to]
             toPort = e.get('toPort')
-            if to not in self.incoming_by_node:
-                self.incoming_by_node[to] = {}
             if toPort:
-                self.incoming_by_node[to][toPort] = frm
+                by_port[toPort] = e.get('from')
             else:
-                # positional
-                self.incoming_list_by_node.setdefault(to, []).append(frm)
+                positional[to].append(e.get('from'))
+        self.incoming_by_node: Dict[str, Dict[str, str]] = dict(incoming)
+        self.incoming_list_by_node: Dict[str, List[str]] = dict(positional)
+
+        # binop type -> (a, b) input port names, or (None, None) when node_defs doesn't declare two inputs
+        self._binop_ports: Dict[str, tuple] = {}
+        for t in self.BINOP_OPS:
+            defs = self._defs_norm.get(t, _EMPTY_DEF)[0]
+            self._binop_ports[t] = (defs[0].get('name'), defs[1].get('name')) if len(defs) >= 2 else (None, None)
+
+        # node type -> handler(node, scope); unknown types fall through to the external handlers
+        binop_handlers = {t: self._emit_binop for t in self.BINOP_OPS}
+        self._global_handlers = {
+            'Literal': self._emit_literal,
+            'Cast': self._emit_cast,
+            'Print': self._emit_print,
+            'Call': self._emit_call,
+            **binop_handlers,
+        }
+        self._local_handlers = {
+            'Param': self._emit_param,
+            'Literal': self._emit_literal,
+            'Cast': self._emit_cast,
+            **binop_handlers,
+        }
 
     def emit_include(self):
-        for inc in sorted(self.includes):
-            self.code_lines.append(f"#include {inc}")
-        self.code_lines.append("")
+        self.emit_lines([f"#include {inc}" for inc in sorted(self.includes)])
+        self.emit_line("")
+
+    @property
+    def indent_level(self) -> int:
+        return self._indent_level
+
+    @indent_level.setter
+    def indent_level(self, value: int):
+        # recompute the indent prefix only when the level changes
+        self._indent_level = value
+        prefix = self._indent_prefix_cache.get(value)
+        if prefix is None:
+            prefix = self._indent_prefix_cache[value] = "    " * value
+        self._indent_str = prefix
 
     def indent(self):
-        return "    " * self.indent_level
+        return self._indent_str
 
     def sanitize(self, node_id: str) -> str:
         # Replace invalid identifier characters with '_', ensure doesn't start with digit
-        s = re.sub(r'[^0-9a-zA-Z_]', '_', node_id)
-        if re.match(r'^[0-9]', s):
+        s = _SANITIZE_RE.sub('_', node_id)
+        if s and s[0].isdigit():
             s = '_' + s
         return s
 
@@ -70,17 +146,15 @@ class CppEmitter:
         return self.TYPE_MAP.get(t, t)
 
     def ensure_lib_includes(self, node_type: str):
-        ddef = self.node_defs.get(node_type, {})
-        lib = ddef.get('lib')
+        lib = self._defs_norm.get(node_type, _EMPTY_DEF)[1]
         if lib:
             inc = lib.get('include')
             if inc:
                 self.includes.add(inc)
 
     def escape_string(self, s: str) -> str:
-        # simple C++ string escape
-        esc = s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\t', '\\t')
-        return esc
+        # simple C++ string escape, done in a single translate() pass
+        return s.translate(_ESCAPE_TABLE)
 
     def _marker_start(self, node_id: str, port: Optional[str]) -> str:
         # unique start marker comment (kept for compatibility/debug)
@@ -90,8 +164,13 @@ class CppEmitter:
     def _marker_end(self) -> str:
         return "/*__ENDNODE__*/"
 
+    def _add_mapping(self, entry: Dict[str, Any]):
+        # every mapping entry goes through here so mapping_by_node stays in step with mapping
+        self.mapping.append(entry)
+        self.mapping_by_node.setdefault(entry['node_id'], []).append(entry)
+
     def record_map(self, node_id: str, start_line: int, end_line: int, function: Optional[str] = None, port: Optional[str] = None):
-        self.mapping.append({
+        self._add_mapping({
             'node_id': node_id,
             'function': function,
             'start_line': start_line,
@@ -101,61 +180,75 @@ class CppEmitter:
             'port': port
         })
 
+    def emit_line(self, text: str) -> int:
+        """
+        Appends a single line of output to code_lines. All emission goes through here
+        (directly or via emit_line_with_fragments) so code_lines stays the one line buffer.
+        Returns the 1-based line number.
+        """
+        self.code_lines.append(text)
+        self._line_no += 1
+        return self._line_no
+
+    def emit_lines(self, lines: List[str]) -> int:
+        """
+        Appends several lines at once. Returns the 1-based number of the last line.
+        """
+        self.code_lines.extend(lines)
+        self._line_no += len(lines)
+        return self._line_no
+
     def emit_line_with_fragments(self, fragments: List[Dict[str, Any]], function: Optional[str] = None):
         """
         fragments: list of { 'text': str, optional 'marker': { 'node_id':..., 'port':... } }
         Appends the concatenated line to code_lines and records mapping entries for fragments that have marker.
         Returns the 1-based line number.
         """
-        line_text = ''.join([f.get('text', '') for f in fragments])
-        self.code_lines.append(line_text)
-        line_no = len(self.code_lines)
+        # single pass: collect texts, track column offset and record markers as we go
+        line_no = self._line_no + 1
+        texts: List[str] = []
+        append = texts.append
+        mapping_append = self._add_mapping
         offset = 0
         for frag in fragments:
             text = frag.get('text', '')
+            append(text)
+            length = len(text)
             mk = frag.get('marker')
             if mk:
-                node_id = mk.get('node_id')
-                port = mk.get('port')
-                start_col = offset + 1
-                end_col = offset + len(text)
                 # Append precise mapping entry
-                self.mapping.append({
-                    'node_id': node_id,
+                mapping_append({
+                    'node_id': mk.get('node_id'),
                     'function': function,
                     'start_line': line_no,
                     'end_line': line_no,
-                    'start_col': start_col,
-                    'end_col': end_col,
-                    'port': port
+                    'start_col': offset + 1,
+                    'end_col': offset + length,
+                    'port': mk.get('port')
                 })
-            offset += len(text)
+            offset += length
+        self.emit_line(''.join(texts))
         return line_no
 
+    def record_port_expr_precise(self, node_id: str, port: str, line: int, start_col: int, end_col: int, function: Optional[str] = None):
+        # Record a port mapping whose columns are already known (e.g. from a fragment offset)
+        self._add_mapping({
+            'node_id': node_id,
+            'function': function,
+            'start_line': line,
+            'end_line': line,
+            'start_col': start_col,
+            'end_col': end_col,
+            'port': port
+        })
+
     def record_port_expr(self, node_id: str, port: str, marker_expr: str, line: int):
-        # Backwards-compatible fallback: try to resolve and record mapping using the already-emitted line
-        # If the marker_expr is the raw expression (no markers), we will find it; otherwise fallback to stored list
-        try:
-            if 1 <= line <= len(self.code_lines):
-                text = self.code_lines[line-1]
-                idx = text.find(marker_expr)
-                if idx >= 0:
-                    start_col = idx + 1
-                    end_col = start_col + len(marker_expr) - 1
-                    self.mapping.append({
-                        'node_id': node_id,
-                        'function': None,
-                        'start_line': line,
-                        'end_line': line,
-                        'start_col': start_col,
-                        'end_col': end_col,
-                        'port': port
-                    })
-                    return
-        except Exception:
-            pass
-        # Fallback: record for later resolution
-        self._port_mappings.append({'node_id': node_id, 'port': port, 'expr': marker_expr, 'line': line})
+        # Deprecated: scans an already-emitted line for marker_expr. Emit the expression as a marked
+        # fragment via emit_line_with_fragments, or call record_port_expr_precise, instead.
+        if 1 <= line <= len(self.code_lines):
+            idx = self.code_lines[line-1].find(marker_expr)
+            if idx >= 0:
+                self.record_port_expr_precise(node_id, port, line, idx + 1, idx + len(marker_expr))
 
     def _resolve_input_for_node(self, node: Dict[str, Any], port_name: Optional[str], index: Optional[int] = None, local_incoming_map: Optional[Dict[str, str]] = None, local_incoming_list: Optional[Dict[str, List[str]]] = None) -> Optional[str]:
         # Try to resolve an input source node id by port name or positional index.
@@ -179,48 +272,62 @@ class CppEmitter:
             return inputs[index]
         return None
 
+    def _resolve_inputs(self, node: Dict[str, Any], port_names, local_incoming_map: Optional[Dict[str, Dict[str, str]]] = None, local_incoming_list: Optional[Dict[str, List[str]]] = None) -> List[Optional[str]]:
+        # Batched form of _resolve_input_for_node(port) + positional fallback: the node's incoming
+        # maps are fetched once, then each input resolves by port name (function-local, then global),
+        # else by position (local list, global list, legacy node.inputs).
+        nid = node['id']
+        by_port_local = (local_incoming_map.get(nid) if local_incoming_map else None) or {}
+        by_port = self.incoming_by_node.get(nid) or {}
+        pos_local = (local_incoming_list.get(nid) if local_incoming_list else None) or ()
+        pos = self.incoming_list_by_node.get(nid) or ()
+        legacy = node.get('inputs') or ()
+        srcs: List[Optional[str]] = []
+        for idx, pname in enumerate(port_names):
+            src = None
+            if pname:
+                src = by_port_local.get(pname)
+                if src is None:
+                    src = by_port.get(pname)
+            if src is None:
+                if idx < len(pos_local):
+                    src = pos_local[idx]
+                elif idx < len(pos):
+                    src = pos[idx]
+                elif idx < len(legacy):
+                    src = legacy[idx]
+            srcs.append(src)
+        return srcs
+
     def _finalize_mappings(self):
         # compute start_col/end_col for coarse mapping entries based on code_lines
         # code_lines are 0-indexed, mapping lines are 1-indexed
+        code_lines = self.code_lines
+        num_lines = len(code_lines)
+        # per-line (first non-space col, line length), computed once per referenced line
+        line_info: List[Optional[tuple]] = [None] * num_lines
+
+        def info(line: int) -> tuple:
+            cached = line_info[line-1]
+            if cached is None:
+                line_text = code_lines[line-1]
+                cached = (len(line_text) - len(line_text.lstrip(' ')) + 1, len(line_text))
+                line_info[line-1] = cached
+            return cached
+
         for m in self.mapping:
-            s = m.get('start_line')
-            e = m.get('end_line')
-            if s and 1 <= s <= len(self.code_lines):
-                line_text = self.code_lines[s-1]
-                # find first non-space char
-                first = len(line_text) - len(line_text.lstrip(' ')) + 1
-                if m.get('start_col') is None:
-                    m['start_col'] = first
-            if e and 1 <= e <= len(self.code_lines):
-                line_text = self.code_lines[e-1]
-                if m.get('end_col') is None:
-                    m['end_col'] = len(line_text)
-        # resolve any remaining port mappings by searching for expressions in the specified line
-        for p in self._port_mappings:
-            line = p.get('line')
-            expr = p.get('expr')
-            node_id = p.get('node_id')
-            port = p.get('port')
-            if not line or line < 1 or line > len(self.code_lines):
-                continue
-            text = self.code_lines[line-1]
-            idx = text.find(expr)
-            if idx >= 0:
-                start_col = idx + 1
-                end_col = start_col + len(expr) - 1
-                # append a mapping entry for this port
-                self.mapping.append({
-                    'node_id': node_id,
-                    'function': None,
-                    'start_line': line,
-                    'end_line': line,
-                    'start_col': start_col,
-                    'end_col': end_col,
-                    'port': port
-                })
+            if m.get('start_col') is None:
+                s = m.get('start_line')
+                if s and 1 <= s <= num_lines:
+                    m['start_col'] = info(s)[0]
+            if m.get('end_col') is None:
+                e = m.get('end_line')
+                if e and 1 <= e <= num_lines:
+                    m['end_col'] = info(e)[1]
 
     def emit_function_def(self, func: Dict[str, Any]):
         # func: {name, params, returnType, graph}
+        _cpp_type = self.TYPE_MAP.get  # bound once; TYPE_MAP.get(t, t) is cpp_type(t)
         name = func.get('name')
         params = func.get('params', [])
         return_type = func.get('returnType', 'void')
@@ -228,36 +335,37 @@ class CppEmitter:
         nodes = graph.get('nodes', [])
         edges = graph.get('edges', []) or []
         # build local incoming maps for function graph
-        local_incoming_map: Dict[str, Dict[str, str]] = {}
-        local_incoming_list: Dict[str, List[str]] = {}
+        local_map: Dict[str, Dict[str, str]] = defaultdict(dict)
+        local_list: Dict[str, List[str]] = defaultdict(list)
         for e in edges:
-            frm = e.get('from')
-            to = e.get('to')
             toPort = e.get('toPort')
             if toPort:
-                local_incoming_map.setdefault(to, {})[toPort] = frm
+                local_map[e.get('to')][toPort] = e.get('from')
             else:
-                local_incoming_list.setdefault(to, []).append(frm)
+                local_list[e.get('to')].append(e.get('from'))
+        local_incoming_map: Dict[str, Dict[str, str]] = dict(local_map)
+        local_incoming_list: Dict[str, List[str]] = dict(local_list)
 
         # collect includes from nodes
         for n in nodes:
             self.ensure_lib_includes(n.get('type'))
         # signature
-        cpp_return = self.cpp_type(return_type) if return_type else 'void'
+        cpp_return = _cpp_type(return_type, return_type) if return_type else 'void'
         param_list = []
         for p in params:
-            ptype = self.cpp_type(p.get('type', 'auto'))
+            ptype = p.get('type', 'auto')
+            ptype = _cpp_type(ptype, ptype)
             pname = p.get('name')
             param_list.append(f"{ptype} {pname}")
         sig = f"{cpp_return} {name}({', '.join(param_list)})"
-        self.code_lines.append(sig + ' {')
+        self.emit_line(sig + ' {')
         self.indent_level += 1
         # local emitter state
         local_var_names: Dict[str, str] = {}
         local_used_names: Dict[str, int] = {}
 
         def local_make_var(node_id: str) -> str:
-            base = 'v_' + re.sub(r'[^0-9a-zA-Z_]', '_', node_id)
+            base = 'v_' + self.sanitize(node_id)
             count = local_used_names.get(base, 0)
             if count == 0:
                 local_used_names[base] = 1
@@ -266,171 +374,53 @@ class CppEmitter:
                 local_used_names[base] = count + 1
                 return f"{base}_{count}"
 
-        def wrap_expr_for_port(nid: str, port: str, expr: str) -> str:
-            # kept for compatibility: return raw expr; markers are tracked via fragments
-            return expr
+        scope = _Scope(name, local_var_names, local_make_var, local_incoming_map, local_incoming_list)
 
         # map Param nodes to param names based on properties or order
-        param_nodes = [n for n in nodes if n.get('type') == 'Param']
-        # try to match by properties.name
-        assigned = set()
+        param_nodes_by_name: Dict[Any, List[Dict[str, Any]]] = {}
+        for n in nodes:
+            if n.get('type') == 'Param':
+                param_nodes_by_name.setdefault(n.get('properties', {}).get('name'), []).append(n)
+        # try to match by properties.name; params without a matching node are left for positional assignment
+        unmatched_params = []
         for p in params:
-            pname = p.get('name')
-            matched = None
-            for pn in param_nodes:
-                prop_name = pn.get('properties', {}).get('name')
-                if prop_name == pname and pn['id'] not in assigned:
-                    matched = pn
-                    break
-            if matched:
-                local_var_names[matched['id']] = pname
-                assigned.add(matched['id'])
-
-        # any remaining param nodes assign by order
-        pi = 0
-        for pn in param_nodes:
-            if pn['id'] in assigned:
+            candidates = param_nodes_by_name.get(p.get('name'))
+            if candidates:
+                local_var_names[candidates.pop(0)['id']] = p.get('name')
+            else:
+                unmatched_params.append(p)
+
+        # any remaining param nodes assign by order from the unmatched params
+        leftover = iter(unmatched_params)
+        for n in nodes:
+            if n.get('type') != 'Param' or n['id'] in local_var_names:
                 continue
-            if pi < len(params):
-                local_var_names[pn['id']] = params[pi].get('name')
-                pi += 1
+            p = next(leftover, None)
+            if p is not None:
+                local_var_names[n['id']] = p.get('name')
             else:
                 # give it a generated name
-                local_var_names[pn['id']] = local_make_var(pn['id'])
+                local_var_names[n['id']] = local_make_var(n['id'])
 
         # topological order for function nodes
         try:
             ordered = topological_sort(nodes, edges)
         except ValidationError:
             ordered = nodes
-            self.code_lines.append(self.indent() + '// Warning: topological sort failed inside function, using graph order')
+            self.emit_line(self._indent_str + '// Warning: topological sort failed inside function, using graph order')
 
-        for n in ordered:
-            nid = n['id']
-            ntype = n['type']
-            start = len(self.code_lines) + 1
+        ids, types, fns = self._lower_graph(ordered, self._local_handlers, self._emit_external_local)
+        for nid, ntype, fn, n in zip(ids, types, fns, ordered):
             if ntype == 'Param':
-                # already mapped
-                if nid not in local_var_names:
-                    local_var_names[nid] = local_make_var(nid)
-                # Params don't emit code
-                end = len(self.code_lines)
-                self.record_map(nid, start, end, function=name)
+                # Params emit no code, so there is no line range to map
+                fn(n, scope)
                 continue
-            if ntype == 'Literal':
-                val = n.get('properties', {}).get('value')
-                if isinstance(val, str):
-                    ctype = 'std::string'
-                    lit = f'"{self.escape_string(val)}"'
-                    self.includes.add('<string>')
-                elif isinstance(val, int) or isinstance(val, float):
-                    ctype = 'double'
-                    lit = str(val)
-                else:
-                    ctype = 'auto'
-                    lit = str(val)
-                var = local_make_var(nid)
-                local_var_names[nid] = var
-                fragments = [ {'text': self.indent() + f"{ctype} {var} = "}, {'text': lit, 'marker': {'node_id': nid, 'port': 'out'}}, {'text': ';'} ]
-                self.emit_line_with_fragments(fragments, function=name)
-            elif ntype == 'Cast':
-                # Cast node inside function
-                target = n.get('properties', {}).get('targetType', 'double')
-                in_src = self._resolve_input_for_node(n, 'in', 0, local_incoming_map, local_incoming_list)
-                in_expr = local_var_names.get(in_src, in_src if in_src else '0')
-                out_var = local_make_var(nid)
-                local_var_names[nid] = out_var
-                # choose cast emission
-                tgt = self.cpp_type(target)
-                if _canonical_type(target) in ('double', 'int'):
-                    expr = f"static_cast<{tgt}>({in_expr})"
-                elif _canonical_type(target) == 'string':
-                    self.includes.add('<string>')
-                    expr = f"std::to_string({in_expr})"
-                else:
-                    expr = f"static_cast<{tgt}>({in_expr})"
-                frags = [ {'text': self.indent() + f"{tgt} {out_var} = "}, {'text': expr, 'marker': {'node_id': nid, 'port': 'in'}}, {'text': ';'} ]
-                self.emit_line_with_fragments(frags, function=name)
-            elif ntype in ('Add', 'Sub', 'Mul', 'Div'):
-                # Determine inputs by ports if available, else positional
-                tdef = self.node_defs.get(ntype, {})
-                input_ports = tdef.get('inputs', [])
-                a_src = None
-                b_src = None
-                a_port = None
-                b_port = None
-                # try to resolve by port name
-                if input_ports and len(input_ports) >= 2:
-                    a_name = input_ports[0].get('name')
-                    b_name = input_ports[1].get('name')
-                    a_src = self._resolve_input_for_node(n, a_name, 0, local_incoming_map, local_incoming_list)
-                    b_src = self._resolve_input_for_node(n, b_name, 1, local_incoming_map, local_incoming_list)
-                    a_port = a_name
-                    b_port = b_name
-                # fallback positional
-                if a_src is None:
-                    a_src = self._resolve_input_for_node(n, None, 0, local_incoming_map, local_incoming_list)
-                if b_src is None:
-                    b_src = self._resolve_input_for_node(n, None, 1, local_incoming_map, local_incoming_list)
-                a = local_var_names.get(a_src, a_src if a_src else '0')
-                b = local_var_names.get(b_src, b_src if b_src else '0')
-                op = {'Add': '+', 'Sub': '-', 'Mul': '*', 'Div': '/'}[ntype]
-                var = local_make_var(nid)
-                local_var_names[nid] = var
-                # build fragments: indent + declaration + operand a (marker) + op + operand b (marker) + semicolon
-                fragments = [
-                    {'text': self.indent() + f"double {var} = "},
-                    {'text': a, 'marker': {'node_id': nid, 'port': a_port or 'a'}},
-                    {'text': f" {op} "},
-                    {'text': b, 'marker': {'node_id': nid, 'port': b_port or 'b'}},
-                    {'text': ';'}
-                ]
-                self.emit_line_with_fragments(fragments, function=name)
-            else:
-                # external or unknown
-                ddef = self.node_defs.get(ntype, {})
-                lib = ddef.get('lib')
-                # resolve inputs
-                inputs = n.get('inputs', [])
-                input_vars = []
-                # try port-aware resolution if node_defs has inputs
-                defs_inputs = ddef.get('inputs', [])
-                if defs_inputs:
-                    for idx, p in enumerate(defs_inputs):
-                        pname = p.get('name')
-                        src = self._resolve_input_for_node(n, pname, idx, local_incoming_map, local_incoming_list)
-                        if src is None:
-                            src = self._resolve_input_for_node(n, None, idx, local_incoming_map, local_incoming_list)
-                        input_vars.append(local_var_names.get(src, src if src else '0'))
-                else:
-                    # fallback to positional list
-                    for idx, src in enumerate(inputs):
-                        input_vars.append(local_var_names.get(src, src if src else '0'))
-
-                if lib:
-                    fn_name = lib.get('name')
-                    out_var = local_make_var(nid)
-                    local_var_names[nid] = out_var
-                    returns = ddef.get('outputs', [])
-                    if returns:
-                        out_type = self.cpp_type(returns[0].get('type'))
-                    else:
-                        out_type = 'double'
-                    # build fragments for function call with marker fragments for each arg
-                    frags = [ {'text': self.indent() + f"{out_type} {out_var} = {fn_name}("} ]
-                    for idx, p in enumerate(defs_inputs):
-                        pname = p.get('name')
-                        expr = input_vars[idx] if idx < len(input_vars) else '0'
-                        if idx > 0:
-                            frags.append({'text': ', '})
-                        frags.append({'text': expr, 'marker': {'node_id': nid, 'port': pname}})
-                    frags.append({'text': ');'})
-                    self.emit_line_with_fragments(frags, function=name)
-                else:
-                    fragments = [{'text': self.indent() + f"// Unhandled node {nid} of type {ntype} inside function", 'marker': {'node_id': nid, 'port': None}}]
-                    self.emit_line_with_fragments(fragments, function=name)
-            end = len(self.code_lines)
-            self.record_map(nid, start, end, function=name)
+            start = self._line_no + 1
+            marks = len(self.mapping)
+            fn(n, scope)
+            if len(self.mapping) == marks:
+                # no fragment markers were recorded: fall back to a coarse whole-line entry
+                self.record_map(nid, start, self._line_no, function=name)
 
         # emit return statement
         ret_id = graph.get('return')
@@ -445,16 +435,13 @@ class CppEmitter:
                         break
                 if last:
                     ret_id = last['id']
-            ret_expr = local_var_names.get(ret_id, ret_id if ret_id else '0')
-            fragments = [ {'text': self.indent() + f"return "}, {'text': ret_expr, 'marker': {'node_id': f"{name}::return", 'port': 'value'}}, {'text': ';'} ]
+            ret_expr = scope.resolve(ret_id)
+            fragments = [ {'text': self._indent_str + f"return "}, {'text': ret_expr, 'marker': {'node_id': f"{name}::return", 'port': 'value'}}, self._SEMI_FRAG ]
+            # the return value marker maps this line under the function-level special node
             self.emit_line_with_fragments(fragments, function=name)
-            # record return mapping under function-level special node
-            start = len(self.code_lines)
-            end = len(self.code_lines)
-            self.record_map(f"{name}::return", start, end, function=name)
         self.indent_level -= 1
-        self.code_lines.append('}')
-        self.code_lines.append('')
+        self.emit_line('}')
+        self.emit_line('')
 
     def emit_from_graph(self):
         nodes_map = {n['id']: n for n in self.ir.get('nodes', [])}
@@ -463,204 +450,250 @@ class CppEmitter:
             ordered = topological_sort(nodes_list, self.ir.get('edges', []))
         except ValidationError:
             # Fallback: use insertion order but warn via comment
-            self.code_lines.append(self.indent() + '// Warning: topological sort failed, using graph order')
+            self.emit_line(self._indent_str + '// Warning: topological sort failed, using graph order')
             ordered = nodes_list
 
-        def wrap_expr_for_port(nid: str, port: str, expr: str) -> str:
-            return expr
+        # function signatures by name, looked up by Call nodes
+        self._functions_by_name = {f['name']: f for f in self.ir.get('functions', []) or []}
 
-        for n in ordered:
-            nid = n['id']
-            ntype = n['type']
+        scope = _Scope(None, self.var_names, self.make_var)
+        ids, types, fns = self._lower_graph(ordered, self._global_handlers, self._emit_external_global)
+        for nid, ntype, fn, n in zip(ids, types, fns, ordered):
             self.ensure_lib_includes(ntype)
-            start = len(self.code_lines) + 1
-            if ntype == 'Literal':
-                val = n.get('properties', {}).get('value')
-                # infer type
-                if isinstance(val, str):
-                    ctype = 'std::string'
-                    lit = f'"{self.escape_string(val)}"'
-                    self.includes.add('<string>')
-                elif isinstance(val, int) or isinstance(val, float):
-                    ctype = 'double'
-                    lit = str(val)
-                else:
-                    ctype = 'auto'
-                    lit = str(val)
-                var = self.make_var(nid)
-                self.var_names[nid] = var
-                fragments = [ {'text': self.indent() + f"{ctype} {var} = "}, {'text': lit, 'marker': {'node_id': nid, 'port': 'out'}}, {'text': ';'} ]
-                self.emit_line_with_fragments(fragments, function=name)
-            elif ntype in ('Add', 'Sub', 'Mul', 'Div'):
-                tdef = self.node_defs.get(ntype, {})
-                input_ports = tdef.get('inputs', [])
-                # resolve by ports if possible
-                a_src = None
-                b_src = None
-                a_port = None
-                b_port = None
-                if input_ports and len(input_ports) >= 2:
-                    a_name = input_ports[0].get('name')
-                    b_name = input_ports[1].get('name')
-                    a_src = self._resolve_input_for_node(n, a_name, 0)
-                    b_src = self._resolve_input_for_node(n, b_name, 1)
-                    a_port = a_name
-                    b_port = b_name
-                if a_src is None:
-                    a_src = self._resolve_input_for_node(n, None, 0)
-                if b_src is None:
-                    b_src = self._resolve_input_for_node(n, None, 1)
-                a = self.var_names.get(a_src, a_src if a_src else '0')
-                b = self.var_names.get(b_src, b_src if b_src else '0')
-                op = {'Add': '+', 'Sub': '-', 'Mul': '*', 'Div': '/'}[ntype]
-                var = self.make_var(nid)
-                self.var_names[nid] = var
-                fragments = [
-                    {'text': self.indent() + f"double {var} = "},
-                    {'text': a, 'marker': {'node_id': nid, 'port': a_port or 'a'}},
-                    {'text': f" {op} "},
-                    {'text': b, 'marker': {'node_id': nid, 'port': b_port or 'b'}},
-                    {'text': ';'}
-                ]
-                self.emit_line_with_fragments(fragments, function=None)
-            elif ntype == 'Print':
-                # resolve input value by named port or positional
-                tdef = self.node_defs.get('Print', {})
-                input_ports = tdef.get('inputs', [])
-                src_id = None
-                src_port = None
-                if input_ports and len(input_ports) >= 1:
-                    pname = input_ports[0].get('name')
-                    src_id = self._resolve_input_for_node(n, pname, 0)
-                    src_port = pname
-                if src_id is None:
-                    src_id = self._resolve_input_for_node(n, None, 0)
-                if not src_id:
-                    self.code_lines.append(self.indent() + f"// Print node {nid} has no input")
-                    end = len(self.code_lines)
-                    self.record_map(nid, start, end, function=None)
-                    continue
-                src = self.var_names.get(src_id, None)
-                if src is None:
-                    src = '\"\"'
-                fragments = [
-                    {'text': self.indent() + 'std::cout << '},
-                    {'text': src, 'marker': {'node_id': nid, 'port': src_port or 'value'}},
-                    {'text': ' << std::endl;'}
-                ]
-                self.emit_line_with_fragments(fragments, function=None)
-            elif ntype == 'Cast':
-                target = n.get('properties', {}).get('targetType', 'double')
-                in_src = self._resolve_input_for_node(n, 'in', 0)
-                in_expr = self.var_names.get(in_src, in_src if in_src else '0')
-                out_var = self.make_var(nid)
-                self.var_names[nid] = out_var
-                tgt = self.cpp_type(target)
-                if _canonical_type(target) in ('double', 'int'):
-                    expr = f"static_cast<{tgt}>({in_expr})"
-                elif _canonical_type(target) == 'string':
-                    self.includes.add('<string>')
-                    expr = f"std::to_string({in_expr})"
-                else:
-                    expr = f"static_cast<{tgt}>({in_expr})"
-                frags = [ {'text': self.indent() + f"{tgt} {out_var} = "}, {'text': expr, 'marker': {'node_id': nid, 'port': 'in'}}, {'text': ';'} ]
-                self.emit_line_with_fragments(frags, function=None)
-            elif ntype == 'Call':
-                props = n.get('properties', {})
-                fname = props.get('name')
-                # find function signature in IR
-                functions = {f['name']: f for f in self.ir.get('functions', [])}
-                fdef = functions.get(fname)
-                # resolve args using function param names if available
-                wrapped_args = []
-                if fdef:
-                    params = fdef.get('params', [])
-                    for idx, p in enumerate(params):
-                        pname = p.get('name')
-                        src = self._resolve_input_for_node(n, pname, idx)
-                        if src is None:
-                            src = self._resolve_input_for_node(n, None, idx)
-                        expr = self.var_names.get(src, src if src else '0')
-                        wrapped_args.append((pname, expr))
-                else:
-                    for idx, src in enumerate(n.get('inputs', [])):
-                        expr = self.var_names.get(src, src)
-                        wrapped_args.append((f'arg{idx}', expr))
-
-                out_var = self.make_var(nid)
-                self.var_names[nid] = out_var
-                if fdef:
-                    ret_type = fdef.get('returnType', 'number')
-                    cpp_ret = self.cpp_type(ret_type)
-                else:
-                    cpp_ret = 'auto'
-                # build fragments
-                frags = [ {'text': self.indent() + f"{cpp_ret} {out_var} = {fname}("} ]
-                for i, (pname, expr) in enumerate(wrapped_args):
-                    if i > 0:
-                        frags.append({'text': ', '})
-                    frags.append({'text': expr, 'marker': {'node_id': nid, 'port': pname}})
-                frags.append({'text': ');'})
-                self.emit_line_with_fragments(frags, function=None)
+            start = self._line_no + 1
+            marks = len(self.mapping)
+            fn(n, scope)
+            if len(self.mapping) == marks:
+                # no fragment markers were recorded: fall back to a coarse whole-line entry
+                self.record_map(nid, start, self._line_no, function=None)
+
+    def _lower_graph(self, ordered: List[Dict[str, Any]], handlers: Dict[str, Any], default) -> tuple:
+        """
+        Lowers topologically ordered nodes into parallel lists (ids, types, handlers) in one pass,
+        so the emission loop does no per-node dict key or handler lookups.
+        """
+        ids = [n['id'] for n in ordered]
+        types = [n['type'] for n in ordered]
+        get = handlers.get
+        fns = [get(t, default) for t in types]
+        return ids, types, fns
+
+    # --- per-node-type handlers: handler(node, scope) emits the node's code into the scope ---
+
+    def _emit_param(self, n: Dict[str, Any], scope: '_Scope'):
+        # already mapped to a function parameter; Params don't emit code
+        nid = n['id']
+        if nid not in scope.var_names:
+            scope.var_names[nid] = scope.make_var(nid)
+
+    def _emit_literal(self, n: Dict[str, Any], scope: '_Scope'):
+        nid = n['id']
+        val = n.get('properties', {}).get('value')
+        # infer type
+        if isinstance(val, str):
+            ctype = 'std::string'
+            lit = f'"{self.escape_string(val)}"'
+            self.includes.add('<string>')
+        elif isinstance(val, int) or isinstance(val, float):
+            ctype = 'double'
+            lit = str(val)
+        else:
+            ctype = 'auto'
+            lit = str(val)
+        var = scope.make_var(nid)
+        scope.var_names[nid] = var
+        fragments = [ {'text': self._indent_str + f"{ctype} {var} = "}, {'text': lit, 'marker': {'node_id': nid, 'port': 'out'}}, self._SEMI_FRAG ]
+        self.emit_line_with_fragments(fragments, function=scope.function)
+
+    def _emit_cast(self, n: Dict[str, Any], scope: '_Scope'):
+        nid = n['id']
+        target = n.get('properties', {}).get('targetType', 'double')
+        in_src = self._resolve_input_for_node(n, 'in', 0, scope.incoming_map, scope.incoming_list)
+        in_expr = scope.resolve(in_src)
+        out_var = scope.make_var(nid)
+        scope.var_names[nid] = out_var
+        # casts repeat a handful of targets, so resolve each target's types once per emitter
+        cached = self._cast_target_cache.get(target)
+        if cached is None:
+            cached = self._cast_target_cache[target] = (_canonical_type(target), self.TYPE_MAP.get(target, target))
+        canon, tgt = cached
+        # choose cast emission: strings go through std::to_string, everything else is a static_cast
+        if canon == 'string':
+            self.includes.add('<string>')
+            expr = f"std::to_string({in_expr})"
+        else:
+            expr = f"static_cast<{tgt}>({in_expr})"
+        frags = [ {'text': self._indent_str + f"{tgt} {out_var} = "}, {'text': expr, 'marker': {'node_id': nid, 'port': 'in'}}, self._SEMI_FRAG ]
+        self.emit_line_with_fragments(frags, function=scope.function)
+
+    def _emit_binop(self, n: Dict[str, Any], scope: '_Scope'):
+        # Add/Sub/Mul/Div: determine inputs by ports if available, else positional
+        nid = n['id']
+        ntype = n['type']
+        local_map, local_list = scope.incoming_map, scope.incoming_list
+        # resolve by port name if available, else positional
+        a_port, b_port = self._binop_ports.get(ntype, (None, None))
+        a_src, b_src = self._resolve_inputs(n, (a_port, b_port), local_map, local_list)
+        a = scope.resolve(a_src)
+        b = scope.resolve(b_src)
+        op = self.BINOP_OPS[ntype]
+        var = scope.make_var(nid)
+        scope.var_names[nid] = var
+        # build fragments: indent + declaration + operand a (marker) + op + operand b (marker) + semicolon
+        fragments = [
+            {'text': self._indent_str + f"double {var} = "},
+            {'text': a, 'marker': {'node_id': nid, 'port': a_port or 'a'}},
+            {'text': f" {op} "},
+            {'text': b, 'marker': {'node_id': nid, 'port': b_port or 'b'}},
+            self._SEMI_FRAG
+        ]
+        self.emit_line_with_fragments(fragments, function=scope.function)
+
+    def _emit_print(self, n: Dict[str, Any], scope: '_Scope'):
+        nid = n['id']
+        # resolve input value by named port or positional
+        input_ports = self._defs_norm.get('Print', _EMPTY_DEF)[0]
+        src_port = input_ports[0].get('name') if input_ports else None
+        src_id = self._resolve_inputs(n, (src_port,))[0]
+        if not src_id:
+            self.emit_line(self._indent_str + f"// Print node {nid} has no input")
+            return
+        src = scope.var_names.get(src_id, None)
+        if src is None:
+            src = '\"\"'
+        fragments = [
+            {'text': self._indent_str + 'std::cout << '},
+            {'text': src, 'marker': {'node_id': nid, 'port': src_port or 'value'}},
+            {'text': ' << std::endl;'}
+        ]
+        self.emit_line_with_fragments(fragments, function=scope.function)
+
+    def _emit_call(self, n: Dict[str, Any], scope: '_Scope'):
+        nid = n['id']
+        props = n.get('properties', {})
+        fname = props.get('name')
+        # find function signature in IR
+        fdef = self._functions_by_name.get(fname)
+        # resolve args using function param names if available
+        wrapped_args = []
+        if fdef:
+            pnames = [p.get('name') for p in fdef.get('params', [])]
+            srcs = self._resolve_inputs(n, pnames)
+            wrapped_args = [(pname, scope.resolve(src)) for pname, src in zip(pnames, srcs)]
+        else:
+            for idx, src in enumerate(n.get('inputs', [])):
+                expr = scope.var_names.get(src, src)
+                wrapped_args.append((f'arg{idx}', expr))
+
+        out_var = scope.make_var(nid)
+        scope.var_names[nid] = out_var
+        if fdef:
+            ret_type = fdef.get('returnType', 'number')
+            cpp_ret = self.TYPE_MAP.get(ret_type, ret_type)
+        else:
+            cpp_ret = 'auto'
+        # build fragments
+        frags = [ {'text': self._indent_str + f"{cpp_ret} {out_var} = {fname}("} ]
+        for i, (pname, expr) in enumerate(wrapped_args):
+            if i > 0:
+                frags.append(self._COMMA_FRAG)
+            frags.append({'text': expr, 'marker': {'node_id': nid, 'port': pname}})
+        frags.append(self._CLOSE_CALL_FRAG)
+        self.emit_line_with_fragments(frags, function=scope.function)
+
+    def _emit_external_global(self, n: Dict[str, Any], scope: '_Scope'):
+        # external or unknown node: try to map via node_defs
+        nid = n['id']
+        ntype = n['type']
+        defs_inputs, lib, returns = self._defs_norm.get(ntype, _EMPTY_DEF)
+        wrapped_args = []
+        if defs_inputs:
+            pnames = [p.get('name') for p in defs_inputs]
+            srcs = self._resolve_inputs(n, pnames)
+            wrapped_args = [(pname, scope.resolve(src)) for pname, src in zip(pnames, srcs)]
+        else:
+            for idx, src in enumerate(n.get('inputs', [])):
+                expr = scope.var_names.get(src, src)
+                wrapped_args.append((f'arg{idx}', expr))
+        if lib:
+            fn_name = lib.get('name')
+            out_var = scope.make_var(nid)
+            scope.var_names[nid] = out_var
+            if returns:
+                out_type = returns[0].get('type')
+                out_type = self.TYPE_MAP.get(out_type, out_type)
             else:
-                # external or unknown node: try to map via node_defs
-                ddef = self.node_defs.get(n.get('type'), {})
-                lib = ddef.get('lib')
-                defs_inputs = ddef.get('inputs', [])
-                wrapped_args = []
-                if defs_inputs:
-                    for idx, p in enumerate(defs_inputs):
-                        pname = p.get('name')
-                        src = self._resolve_input_for_node(n, pname, idx)
-                        if src is None:
-                            src = self._resolve_input_for_node(n, None, idx)
-                        expr = self.var_names.get(src, src if src else '0')
-                        wrapped_args.append((pname, expr))
-                else:
-                    for idx, src in enumerate(n.get('inputs', [])):
-                        expr = self.var_names.get(src, src)
-                        wrapped_args.append((f'arg{idx}', expr))
-                if lib:
-                    fn_name = lib.get('name')
-                    out_var = self.make_var(nid)
-                    self.var_names[nid] = out_var
-                    returns = ddef.get('outputs', [])
-                    if returns:
-                        out_type = self.cpp_type(returns[0].get('type'))
-                    else:
-                        out_type = 'double'
-                    frags = [ {'text': self.indent() + f"{out_type} {out_var} = {fn_name}("} ]
-                    for i, (pname, expr) in enumerate(wrapped_args):
-                        if i > 0:
-                            frags.append({'text': ', '})
-                        frags.append({'text': expr, 'marker': {'node_id': nid, 'port': pname}})
-                    frags.append({'text': ');'})
-                    self.emit_line_with_fragments(frags, function=None)
-                else:
-                    self.code_lines.append(self.indent() + f"// Unhandled node {nid} of type {ntype}")
-            end = len(self.code_lines)
-            self.record_map(nid, start, end, function=None)
+                out_type = 'double'
+            frags = [ {'text': self._indent_str + f"{out_type} {out_var} = {fn_name}("} ]
+            for i, (pname, expr) in enumerate(wrapped_args):
+                if i > 0:
+                    frags.append(self._COMMA_FRAG)
+                frags.append({'text': expr, 'marker': {'node_id': nid, 'port': pname}})
+            frags.append(self._CLOSE_CALL_FRAG)
+            self.emit_line_with_fragments(frags, function=scope.function)
+        else:
+            self.emit_line(self._indent_str + f"// Unhandled node {nid} of type {ntype}")
+
+    def _emit_external_local(self, n: Dict[str, Any], scope: '_Scope'):
+        # external or unknown node inside a function body
+        nid = n['id']
+        ntype = n['type']
+        local_map, local_list = scope.incoming_map, scope.incoming_list
+        defs_inputs, lib, returns = self._defs_norm.get(ntype, _EMPTY_DEF)
+        # resolve inputs
+        inputs = n.get('inputs', [])
+        input_vars = []
+        # try port-aware resolution if node_defs has inputs
+        if defs_inputs:
+            srcs = self._resolve_inputs(n, [p.get('name') for p in defs_inputs], local_map, local_list)
+            input_vars = [scope.resolve(src) for src in srcs]
+        else:
+            # fallback to positional list
+            for idx, src in enumerate(inputs):
+                input_vars.append(scope.resolve(src))
+
+        if lib:
+            fn_name = lib.get('name')
+            out_var = scope.make_var(nid)
+            scope.var_names[nid] = out_var
+            if returns:
+                out_type = returns[0].get('type')
+                out_type = self.TYPE_MAP.get(out_type, out_type)
+            else:
+                out_type = 'double'
+            # build fragments for function call with marker fragments for each arg
+            frags = [ {'text': self._indent_str + f"{out_type} {out_var} = {fn_name}("} ]
+            for idx, p in enumerate(defs_inputs):
+                pname = p.get('name')
+                expr = input_vars[idx] if idx < len(input_vars) else '0'
+                if idx > 0:
+                    frags.append(self._COMMA_FRAG)
+                frags.append({'text': expr, 'marker': {'node_id': nid, 'port': pname}})
+            frags.append(self._CLOSE_CALL_FRAG)
+            self.emit_line_with_fragments(frags, function=scope.function)
+        else:
+            fragments = [{'text': self._indent_str + f"// Unhandled node {nid} of type {ntype} inside function", 'marker': {'node_id': nid, 'port': None}}]
+            self.emit_line_with_fragments(fragments, function=scope.function)
 
     def emit_main(self):
-        self.code_lines.append("int main() {")
+        self.emit_line("int main() {")
         self.indent_level += 1
         self.emit_from_graph()
-        self.code_lines.append(self.indent() + "return 0;")
+        self.emit_lines([self._indent_str + "return 0;", "}"])
         self.indent_level -= 1
-        self.code_lines.append("}")
 
     def emit(self) -> str:
-        # include lib headers from functions and nodes
+        # include lib headers from functions and nodes, once per distinct node type
+        types_seen = set()
         for f in self.ir.get('functions', []):
             # collect node types in function graph
-            for n in f.get('graph', {}).get('nodes', []):
-                self.ensure_lib_includes(n.get('type'))
-        for n in self.ir.get('nodes', []):
-            self.ensure_lib_includes(n.get('type'))
+            types_seen.update(n.get('type') for n in f.get('graph', {}).get('nodes', []))
+        types_seen.update(n.get('type') for n in self.ir.get('nodes', []))
+        for t in types_seen:
+            self.ensure_lib_includes(t)
 
         # ensure iostream included
-        if not any('iostream' in inc for inc in self.includes):
-            self.includes.add("<iostream>")
+        self.includes.add("<iostream>")
 
         self.emit_include()
 
@@ -1,3 +1,5 @@
+from collections import defaultdict, deque
+from functools import lru_cache
 from typing import List, Dict, Any, Tuple, Optional
 
 class ValidationError(Exception):
@@ -6,12 +8,12 @@ class ValidationError(Exception):
         self.details = details or {}
 
 
-def build_adj(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]] = None) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
-    # adjacency: node -> list of nodes that depend on it (outgoing), and indegree
+def build_adj(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]] = None) -> Tuple[Dict[str, List[str]], Dict[str, int], Dict[str, Dict[str, Any]]]:
+    # adjacency: node -> list of nodes that depend on it (outgoing), indegree, and id -> node index
     edges = edges or []
-    node_ids = [n['id'] for n in nodes]
-    adj = {nid: [] for nid in node_ids}
-    indeg = {nid: 0 for nid in node_ids}
+    id_to_node = {n['id']: n for n in nodes}
+    adj = {nid: [] for nid in id_to_node}
+    indeg = dict.fromkeys(id_to_node, 0)
     if edges:
         for e in edges:
             frm = e.get('from')
@@ -30,16 +32,22 @@ def build_adj(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]] = None) -
                     raise ValidationError(f"Input reference '{inp}' for node '{n['id']}' not found", {'node': n['id'], 'input': inp})
                 adj[inp].append(n['id'])
                 indeg[n['id']] += 1
-    return adj, indeg
+    return adj, indeg, id_to_node
 
 
 def topological_sort(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-    adj, indeg = build_adj(nodes, edges)
+    """Return nodes in FIFO Kahn order.
+
+    The order is stable: ready nodes come out in declaration order, breadth-first. CppEmitter
+    emits statements in exactly this order (and caches it), so generated code and source
+    mappings stay deterministic; do not swap the queue for a LIFO stack.
+    """
+    adj, indeg, id_to_node = build_adj(nodes, edges)
     # Kahn's algorithm
-    q = [nid for nid, d in indeg.items() if d == 0]
+    q = deque(nid for nid, d in indeg.items() if d == 0)
     order_ids = []
     while q:
-        n = q.pop(0)
+        n = q.popleft()
         order_ids.append(n)
         for m in adj[n]:
             indeg[m] -= 1
@@ -47,23 +55,18 @@ def topological_sort(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]] =
                 q.append(m)
     if len(order_ids) != len(nodes):
         raise ValidationError('Cycle detected in graph', {'cycle': True})
-    id_to_node = {n['id']: n for n in nodes}
     return [id_to_node[i] for i in order_ids]
 
 
+# exact type() dispatch, so bool never falls through to int
+_LIT_TYPES = {bool: 'bool', int: 'int', float: 'double', str: 'string'}
+
+
 def _infer_literal_type(val: Any) -> str:
-    # Distinguish common literal types more precisely
-    if isinstance(val, bool):
-        return 'bool'
-    if isinstance(val, int) and not isinstance(val, bool):
-        return 'int'
-    if isinstance(val, float):
-        return 'double'
-    if isinstance(val, str):
-        return 'string'
-    return 'any'
+    return _LIT_TYPES.get(type(val), 'any')
 
 
+@lru_cache(maxsize=128)
 def _canonical_type(t: Optional[str]) -> str:
     # Normalize type aliases used in node_defs to a canonical family
     if not t:
@@ -101,102 +104,103 @@ def validate_types(nodes: List[Dict[str, Any]], node_defs: Dict[str, Any], edges
     id_to_node = {n['id']: n for n in nodes}
     edges = edges or []
 
+    # per-type port indexes: name lookups for explicit ports, lists for positional matching.
+    # Each port copy carries its canonical type as 'ctype' so the edge loop never re-normalizes;
+    # the declared 'type' is kept for error messages.
+    def _canon_ports(ps):
+        return [{**p, 'ctype': _canonical_type(p.get('type'))} for p in ps]
+    inputs_list_by_type = {t: _canon_ports(d.get('inputs', [])) for t, d in node_defs.items()}
+    outputs_list_by_type = {t: _canon_ports(d.get('outputs', [])) for t, d in node_defs.items()}
+    inputs_by_type = {t: {p.get('name'): p for p in ps} for t, ps in inputs_list_by_type.items()}
+    outputs_by_type = {t: {p.get('name'): p for p in ps} for t, ps in outputs_list_by_type.items()}
+
     # build output type map (literal inference etc.)
     id_to_out_type: Dict[str, str] = {}
-    # first, literals
+    id_to_out_ctype: Dict[str, str] = {}
+    # one pass: literals are inferred from their value (and take precedence), other nodes
+    # take the first declared output type when they have one
     for n in nodes:
-        tdef = node_defs.get(n['type'])
-        if not tdef:
-            raise ValidationError(f"Unknown node type: {n['type']}", {'node_id': n.get('id'), 'node_type': n.get('type')})
-        if n['type'] == 'Literal':
+        t = n['type']
+        if not node_defs.get(t):
+            raise ValidationError(f"Unknown node type: {t}", {'node_id': n.get('id'), 'node_type': t})
+        nid = n['id']
+        if t == 'Literal':
             val = n.get('properties', {}).get('value')
-            id_to_out_type[n['id']] = _infer_literal_type(val)
-
-    # for non-literals, assign from node_defs outputs when possible
-    for n in nodes:
-        if n['id'] in id_to_out_type:
-            continue
-        tdef = node_defs.get(n['type'], {})
-        outs = tdef.get('outputs', [])
-        if outs:
-            # assume first output type as node output type
-            id_to_out_type[n['id']] = outs[0].get('type')
-
-    # Build list of connections: tuples (from, to, toPort, fromPort)
-    conns = []
+            # inferred literal types are already canonical
+            id_to_out_type[nid] = id_to_out_ctype[nid] = _infer_literal_type(val)
+        elif nid not in id_to_out_type:
+            outs = outputs_list_by_type[t]
+            if outs:
+                id_to_out_type[nid] = outs[0].get('type')
+                id_to_out_ctype[nid] = outs[0]['ctype']
+
+    # Group connections (from, to, toPort, fromPort) by destination in order, so positional
+    # mapping can be resolved; references are checked in the same pass since validate_types
+    # may be called without a prior topological_sort
+    incoming_by_dest: Dict[str, List[Tuple[str, str, str, str]]] = defaultdict(list)
     if edges:
-        for e in edges:
-            frm = e.get('from')
-            to = e.get('to')
-            fromPort = e.get('fromPort')
-            toPort = e.get('toPort')
-            conns.append((frm, to, toPort, fromPort))
+        conns = ((e.get('from'), e.get('to'), e.get('toPort'), e.get('fromPort')) for e in edges)
     else:
-        # derive from node.inputs (positional)
-        for n in nodes:
-            for idx, inp in enumerate(n.get('inputs', [])):
-                # positional: we don't know port name, set None and validator will match by index
-                conns.append((inp, n['id'], None, None))
-
-    # validate references exist
-    for (frm, to, toPort, fromPort) in conns:
+        # derive from node.inputs (positional): we don't know port name, set None and validator will match by index
+        conns = ((inp, n['id'], None, None) for n in nodes for inp in n.get('inputs', []))
+    for c in conns:
+        frm, to = c[0], c[1]
         if frm not in id_to_node or to not in id_to_node:
             raise ValidationError(f"Connection references unknown nodes: {frm} -> {to}", {'from': frm, 'to': to})
-
-    # For each destination, gather its incoming conns in order to resolve positional mapping
-    incoming_by_dest: Dict[str, List[Tuple[str, str, str, str]]] = {}
-    for c in conns:
-        frm, to, toPort, fromPort = c
-        incoming_by_dest.setdefault(to, []).append(c)
+        incoming_by_dest[to].append(c)
 
     for dest, incoming in incoming_by_dest.items():
-        dest_node = id_to_node[dest]
-        dest_tdef = node_defs.get(dest_node['type'], {})
-        dest_inputs = dest_tdef.get('inputs', [])
-        valid_input_names = [p.get('name') for p in dest_inputs]
+        dest_type = id_to_node[dest]['type']
+        dest_inputs = inputs_list_by_type.get(dest_type, [])
+        dest_inputs_by_name = inputs_by_type.get(dest_type, {})
         for idx, (frm, to, toPort, fromPort) in enumerate(incoming):
             # determine expected type
             expected = None
             if toPort:
                 # find input port by name
-                found = next((p for p in dest_inputs if p.get('name') == toPort), None)
-                if not found:
+                found = dest_inputs_by_name.get(toPort)
+                if found is None:
                     raise ValidationError(
                         f"Node '{dest}' has no input port named '{toPort}'",
-                        {'node': dest, 'missing_input_port': toPort, 'valid_ports': valid_input_names}
+                        {'node': dest, 'missing_input_port': toPort, 'valid_ports': [p.get('name') for p in dest_inputs]}
                     )
                 expected = found.get('type')
+                e = found['ctype']
             else:
                 # positional: match by index
                 if idx < len(dest_inputs):
                     expected = dest_inputs[idx].get('type')
+                    e = dest_inputs[idx]['ctype']
                 else:
-                    expected = 'any'
+                    expected = e = 'any'
 
             # determine actual type from source node
-            src_node = id_to_node[frm]
-            src_tdef = node_defs.get(src_node['type'], {})
-            src_outputs = src_tdef.get('outputs', [])
+            src_type = id_to_node[frm]['type']
             actual = None
             if fromPort:
-                found_out = next((p for p in src_outputs if p.get('name') == fromPort), None)
-                if not found_out:
+                found_out = outputs_by_type.get(src_type, {}).get(fromPort)
+                if found_out is None:
+                    src_outputs = outputs_list_by_type.get(src_type, [])
                     raise ValidationError(
                         f"Node '{frm}' has no output port named '{fromPort}'",
                         {'node': frm, 'missing_output_port': fromPort, 'valid_output_ports': [p.get('name') for p in src_outputs]}
                     )
                 actual = found_out.get('type')
+                a = found_out['ctype']
             else:
                 # fallback: use known id_to_out_type if determined (e.g., Literal), else first declared output
                 actual = id_to_out_type.get(frm)
+                a = id_to_out_ctype.get(frm)
                 if not actual:
+                    src_outputs = outputs_list_by_type.get(src_type, [])
                     if src_outputs:
                         actual = src_outputs[0].get('type')
+                        a = src_outputs[0]['ctype']
                     else:
-                        actual = 'any'
+                        actual = a = 'any'
 
-            # compare types with coercion rules
-            if not _is_compatible(expected, actual):
+            # compare canonical types with coercion rules (inlined _is_compatible)
+            if not (e == a or e == 'any' or a == 'any' or (e == 'double' and a == 'int')):
                 details = {'from': frm, 'to': to, 'toPort': toPort, 'expected': expected, 'actual': actual}
                 # suggest a cast to expected if safe
                 details['suggested_cast'] = expected
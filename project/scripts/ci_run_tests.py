@@ -11,7 +11,6 @@ Usage: python3 project/scripts/ci_run_tests.py
 
 Exits with non-zero on failure.
 """
-import json
 import os
 import subprocess
 import sys
@@ -19,12 +18,18 @@ import tempfile
 import shutil
 import uuid
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from docker_runner import SandboxPool
+from jsonio import jloads, jload, jdump
+
 ROOT = Path(__file__).resolve().parents[1]
 EXAMPLES_DIR = ROOT / 'examples'
 DOCKER_RUNNER = ROOT / 'scripts' / 'docker_runner.py'
 SANDBOX_IMAGE = os.environ.get('SANDBOX_IMAGE', 'graph-compiler-sandbox')
+# security tests are independent containers and mostly wait on docker, so threads are enough
+CI_WORKERS = int(os.environ.get('CI_WORKERS', os.cpu_count() or 4))
 
 TESTS = [
     {
@@ -61,139 +66,193 @@ if not DOCKER_RUNNER.exists():
     # not fatal here; warnings will be emitted when attempting to use it
 
 node_defs_path = ROOT / 'compiler' / 'node_defs.json'
-node_defs = json.load(open(node_defs_path)) if node_defs_path.exists() else {}
+node_defs = jload(node_defs_path) if node_defs_path.exists() else {}
 
 any_failure = False
 artifacts_root = Path('ci_artifacts')
 artifacts_root.mkdir(exist_ok=True)
 
-# First: run functional example tests via docker_runner (if available)
-for t in TESTS:
-    print('Testing', t['file'])
-    ir = json.load(open(t['file']))
-    tmpdir = tempfile.mkdtemp(prefix='ci_test_')
-    try:
-        input_path = Path(tmpdir) / 'input.json'
-        payload = { 'ir': ir, 'node_defs': node_defs, 'timeout': 5 }
-        with open(input_path, 'w') as f:
-            json.dump(payload, f)
+# one scratch root for the whole run; each test gets a subdirectory and everything is
+# removed in a single cleanup at the end instead of per-test mkdtemp/rmtree
+_ci_tmp = tempfile.TemporaryDirectory(prefix='ci_run_')
+CI_TMP = Path(_ci_tmp.name)
+
+# First: run functional example tests, one at a time, on a single warm sandbox container
+# (docker_runner.SandboxPool of size 1). Each job is piped through `docker exec` with the
+# container's tmpfs as its workspace, and between tests the pool kills leftover processes and
+# wipes the workspace, so tests stay isolated; running them serially keeps each compile within
+# the container's full memory/CPU limits. If no container is available, a test falls back to a
+# fresh container via docker_runner.
+FUNCTIONAL_TIMEOUT = 20
+
+
+def start_shared_sandbox():
+    pool = SandboxPool(
+        SANDBOX_IMAGE, 1,
+        memory=os.environ.get('SANDBOX_MEMORY', '256m'),
+        cpus=os.environ.get('SANDBOX_CPUS', '0.5'),
+        pids_limit=int(os.environ.get('SANDBOX_PIDS_LIMIT', '64')),
+        seccomp=os.environ.get('SANDBOX_SECCOMP'),
+    )
+    if not pool.idle_count():
+        print('Could not start shared sandbox container; using a fresh container per test')
+        pool.close()
+        return None
+    return pool
+
 
-        cmd = [sys.executable, str(DOCKER_RUNNER), '--input-dir', tmpdir, '--image', SANDBOX_IMAGE, '--timeout', '20']
-        print('Running:', ' '.join(cmd))
+def run_functional(i, t):
+    """Run one example IR in the sandbox image. Returns (ok, log lines)."""
+    log = []
+
+    def say(*args):
+        log.append(' '.join(str(a) for a in args))
+
+    say('Testing', t['file'])
+    ir = jload(t['file'])
+    payload = { 'ir': ir, 'node_defs': node_defs, 'timeout': 5 }
+
+    # the pool's scrub after the previous test can take a moment, so wait for the container
+    out = SHARED_SANDBOX.run(payload, timeout=FUNCTIONAL_TIMEOUT, wait=30) if SHARED_SANDBOX else None
+    if out is not None:
+        say('Ran in the shared sandbox container')
+    else:
+        tmpdir = CI_TMP / f'test_{i}'
+        tmpdir.mkdir(exist_ok=True)
+        jdump(tmpdir / 'input.json', payload)
+        cmd = [sys.executable, str(DOCKER_RUNNER), '--input-dir', str(tmpdir), '--image', SANDBOX_IMAGE, '--timeout', str(FUNCTIONAL_TIMEOUT)]
+        say('Running:', ' '.join(cmd))
         proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         if proc.returncode != 0:
-            print('docker_runner failed:', proc.stdout, proc.stderr)
+            say('docker_runner failed:', proc.stdout, proc.stderr)
             # save outputs
             p = artifacts_root / f"functional_{Path(t['file']).stem}"
             p.mkdir(parents=True, exist_ok=True)
             (p / 'docker_runner.stdout.txt').write_text(proc.stdout)
             (p / 'docker_runner.stderr.txt').write_text(proc.stderr)
-            any_failure = True
-            continue
+            return False, log
         try:
-            out = json.loads(proc.stdout)
+            out = jloads(proc.stdout)
         except Exception as e:
-            print('Failed to parse docker_runner output as JSON')
-            print('stdout:', proc.stdout)
-            print('stderr:', proc.stderr)
+            say('Failed to parse docker_runner output as JSON')
+            say('stdout:', proc.stdout)
+            say('stderr:', proc.stderr)
             p = artifacts_root / f"functional_{Path(t['file']).stem}"
             p.mkdir(parents=True, exist_ok=True)
             (p / 'runner_raw_stdout.txt').write_text(proc.stdout)
             (p / 'runner_raw_stderr.txt').write_text(proc.stderr)
-            any_failure = True
-            continue
+            return False, log
 
-        if not out.get('success'):
-            print('Container reported failure:', out)
-            p = artifacts_root / f"functional_{Path(t['file']).stem}"
-            p.mkdir(parents=True, exist_ok=True)
-            (p / 'container_output.json').write_text(json.dumps(out, indent=2))
-            any_failure = True
-            continue
-
-        # The container's output JSON may contain stdout field
-        stdout = out.get('stdout') or out.get('_container_stdout') or ''
-        if t['expect_substr'] not in stdout:
-            print('Unexpected output for', t['file'])
-            print('Expected substring:', t['expect_substr'])
-            print('Actual stdout:', stdout)
-            p = artifacts_root / f"functional_{Path(t['file']).stem}"
-            p.mkdir(parents=True, exist_ok=True)
-            (p / 'container_output.json').write_text(json.dumps(out, indent=2))
-            any_failure = True
-            continue
+    if not out.get('success'):
+        say('Container reported failure:', out)
+        p = artifacts_root / f"functional_{Path(t['file']).stem}"
+        p.mkdir(parents=True, exist_ok=True)
+        jdump(p / 'container_output.json', out, indent=True)
+        return False, log
 
-        print('Test passed for', t['file'])
-    finally:
-        try:
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
+    # The container's output JSON may contain stdout field
+    stdout = out.get('stdout') or out.get('_container_stdout') or ''
+    if t['expect_substr'] not in stdout:
+        say('Unexpected output for', t['file'])
+        say('Expected substring:', t['expect_substr'])
+        say('Actual stdout:', stdout)
+        p = artifacts_root / f"functional_{Path(t['file']).stem}"
+        p.mkdir(parents=True, exist_ok=True)
+        jdump(p / 'container_output.json', out, indent=True)
+        return False, log
+
+    say('Test passed for', t['file'])
+    return True, log
+
+
+SHARED_SANDBOX = start_shared_sandbox()
+try:
+    functional_results = [run_functional(i, t) for i, t in enumerate(TESTS)]
+finally:
+    if SHARED_SANDBOX:
+        SHARED_SANDBOX.close()
+for ok, log in functional_results:
+    print('\n'.join(log))
+    if not ok:
+        any_failure = True
 
 # Second: run security smoke tests by invoking docker run with similar flags
 # We'll create a container name per-test so we can inspect and collect logs
 
 def run_security_test(test, image, timeout_sec=10):
     name = f"ci_sec_{test['name']}_{uuid.uuid4().hex[:8]}"
-    workspace = tempfile.mkdtemp(prefix=f"sec_{test['name']}_")
+    workspace = CI_TMP / f"sec_{test['name']}"
+    workspace.mkdir(exist_ok=True)
+    # copy source into workspace
+    shutil.copy(test['source'], workspace)
+    src_name = os.path.basename(str(test['source']))
+    # build the compile/run command to execute inside container
+    # compile with gcc and run the produced binary
+    inner_cmd = f"gcc /workspace/{src_name} -o /workspace/test_bin && /workspace/test_bin"
+    # build docker run flags mirroring docker_runner defaults
+    run_cmd = [
+        'docker', 'run', '--name', name,
+        '--network', 'none',
+        '--cap-drop', 'ALL',
+        '--security-opt', 'no-new-privileges',
+        '--read-only',
+        '--pids-limit', os.environ.get('SANDBOX_PIDS_LIMIT', '64'),
+        '--memory', os.environ.get('SANDBOX_MEMORY', '256m'),
+        '--cpus', os.environ.get('SANDBOX_CPUS', '0.5'),
+        '-v', f"{workspace}:/workspace:rw",
+        '--tmpfs', '/tmp:rw',
+        image,
+        'bash', '-c', inner_cmd
+    ]
+    print('Running security test:', ' '.join(run_cmd))
     try:
-        # copy source into workspace
-        shutil.copy(test['source'], workspace)
-        src_name = os.path.basename(str(test['source']))
-        # build the compile/run command to execute inside container
-        # compile with gcc and run the produced binary
-        inner_cmd = f"gcc /workspace/{src_name} -o /workspace/test_bin && /workspace/test_bin"
-        # build docker run flags mirroring docker_runner defaults
-        run_cmd = [
-            'docker', 'run', '--name', name,
-            '--network', 'none',
-            '--cap-drop', 'ALL',
-            '--security-opt', 'no-new-privileges',
-            '--read-only',
-            '--pids-limit', os.environ.get('SANDBOX_PIDS_LIMIT', '64'),
-            '--memory', os.environ.get('SANDBOX_MEMORY', '256m'),
-            '--cpus', os.environ.get('SANDBOX_CPUS', '0.5'),
-            '-v', f"{workspace}:/workspace:rw",
-            '--tmpfs', '/tmp:rw',
-            image,
-            'bash', '-c', inner_cmd
-        ]
-        print('Running security test:', ' '.join(run_cmd))
         proc = subprocess.run(run_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout_sec)
-        stdout = proc.stdout
-        stderr = proc.stderr
-        rc = proc.returncode
-        # collect docker inspect for HostConfig
-        inspect_proc = subprocess.run(['docker', 'inspect', name, '--format', '{{json .HostConfig}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        inspect_json = inspect_proc.stdout if inspect_proc.returncode == 0 else ''
-        return {'rc': rc, 'stdout': stdout, 'stderr': stderr, 'inspect': inspect_json, 'name': name, 'workspace': workspace}
+        res = {'rc': proc.returncode, 'stdout': proc.stdout, 'stderr': proc.stderr, 'name': name, 'workspace': str(workspace)}
     except subprocess.TimeoutExpired:
-        # kill and collect logs
-        try:
-            subprocess.run(['docker', 'kill', name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except Exception:
-            pass
+        # kill and collect logs; only a timed-out run needs docker logs, otherwise the
+        # output already came back from docker run
+        subprocess.run(['docker', 'kill', name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         logs = subprocess.run(['docker', 'logs', name], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        inspect_proc = subprocess.run(['docker', 'inspect', name, '--format', '{{json .HostConfig}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        inspect_json = inspect_proc.stdout if inspect_proc.returncode == 0 else ''
-        return {'rc': None, 'stdout': logs.stdout, 'stderr': logs.stderr, 'inspect': inspect_json, 'name': name, 'workspace': workspace, 'timed_out': True}
-    finally:
-        # attempt to copy logs and then remove container
-        try:
-            logs = subprocess.run(['docker', 'logs', name], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            (Path(workspace) / 'container_stdout.log').write_text(logs.stdout)
-            (Path(workspace) / 'container_stderr.log').write_text(logs.stderr)
-        except Exception:
-            pass
-        try:
-            subprocess.run(['docker', 'rm', '-f', name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except Exception:
-            pass
+        res = {'rc': None, 'stdout': logs.stdout, 'stderr': logs.stderr, 'name': name, 'workspace': str(workspace), 'timed_out': True}
+    # keep a copy of the logs; the container itself is kept for the batched inspect/rm below
+    try:
+        (workspace / 'container_stdout.log').write_text(res['stdout'])
+        (workspace / 'container_stderr.log').write_text(res['stderr'])
+    except Exception:
+        pass
+    return res
+
+
+def inspect_host_configs(names):
+    """HostConfig JSON for each container name, from a single docker inspect call."""
+    if not names:
+        return {}
+    # docker inspect still prints the containers it found when some are missing, so key by name
+    proc = subprocess.run(['docker', 'inspect', '--format', '{{.Name}} {{json .HostConfig}}', *names], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    configs = {}
+    for line in proc.stdout.splitlines():
+        cname, _, hostcfg = line.partition(' ')
+        configs[cname.lstrip('/')] = hostcfg
+    return configs
+
+
+def remove_containers(names):
+    if not names:
+        return
+    try:
+        subprocess.run(['docker', 'rm', '-f', *names], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except Exception:
+        pass
+
+
+def check_security(test, res):
+    """Check one security smoke test result. Returns (ok, log lines)."""
+    log = []
 
+    def say(*args):
+        log.append(' '.join(str(a) for a in args))
 
-for test in SECURITY_TESTS:
-    print('\nRunning security test:', test['name'])
-    res = run_security_test(test, SANDBOX_IMAGE, timeout_sec=12)
+    say('\nSecurity test:', test['name'])
     p = artifacts_root / f"security_{test['name']}"
     p.mkdir(parents=True, exist_ok=True)
     # save workspace files
@@ -204,7 +263,7 @@ for test in SECURITY_TESTS:
     except Exception:
         pass
     # write runner outputs
-    (p / 'result.json').write_text(json.dumps(res, indent=2))
+    jdump(p / 'result.json', res, indent=True)
 
     # analyze result
     timed_out = res.get('timed_out', False)
@@ -213,7 +272,7 @@ for test in SECURITY_TESTS:
     hostcfg_ok = False
     try:
         if inspect_json:
-            hostcfg = json.loads(inspect_json)
+            hostcfg = jloads(inspect_json)
             capdrop = hostcfg.get('CapDrop', [])
             secopt = hostcfg.get('SecurityOpt', [])
             if 'ALL' in capdrop and any('no-new-privileges' in s for s in secopt):
@@ -222,33 +281,42 @@ for test in SECURITY_TESTS:
         hostcfg_ok = False
 
     if not hostcfg_ok:
-        print(f"Security test {test['name']}: host config missing expected hardening flags")
-        any_failure = True
-        continue
+        say(f"Security test {test['name']}: host config missing expected hardening flags")
+        return False, log
 
     if test.get('expect_blocked_prefix'):
         stdout = res.get('stdout', '') or ''
         if not stdout.strip().startswith(test['expect_blocked_prefix']):
-            print(f"Security test {test['name']} failed: syscall appears allowed; stdout=", stdout)
-            any_failure = True
-            continue
+            say(f"Security test {test['name']} failed: syscall appears allowed; stdout=", stdout)
+            return False, log
         else:
-            print(f"Security test {test['name']} passed (syscall blocked)")
+            say(f"Security test {test['name']} passed (syscall blocked)")
     elif test.get('expect_timeout'):
         if res.get('timed_out') or res.get('rc') is None:
-            print(f"Security test {test['name']} passed (timed out as expected)")
+            say(f"Security test {test['name']} passed (timed out as expected)")
         else:
-            print(f"Security test {test['name']} failed: expected timeout but rc={res.get('rc')}, stdout={res.get('stdout')}")
-            any_failure = True
-            continue
+            say(f"Security test {test['name']} failed: expected timeout but rc={res.get('rc')}, stdout={res.get('stdout')}")
+            return False, log
     else:
-        print(f"Security test {test['name']} unrecognized expectations; raw result saved to {p}")
+        say(f"Security test {test['name']} unrecognized expectations; raw result saved to {p}")
+    return True, log
 
-    # cleanup workspace
-    try:
-        shutil.rmtree(res['workspace'])
-    except Exception:
-        pass
+
+with ThreadPoolExecutor(max_workers=max(1, min(CI_WORKERS, len(SECURITY_TESTS)))) as pool:
+    security_runs = list(pool.map(lambda t: run_security_test(t, SANDBOX_IMAGE, timeout_sec=12), SECURITY_TESTS))
+container_names = [res['name'] for res in security_runs]
+try:
+    host_configs = inspect_host_configs(container_names)
+finally:
+    remove_containers(container_names)
+for res in security_runs:
+    res['inspect'] = host_configs.get(res['name'], '')
+for ok, log in (check_security(test, res) for test, res in zip(SECURITY_TESTS, security_runs)):
+    print('\n'.join(log))
+    if not ok:
+        any_failure = True
+
+_ci_tmp.cleanup()
 
 if any_failure:
     print('\nOne or more tests failed')
@@ -0,0 +1,166 @@
+"""
+Content-addressed cache for compile artifacts (emitted C++, binary, source mapping).
+
+Entries are keyed by sha256(pipeline name + canonical emitted-IR JSON + canonical node_defs JSON + compile flags +
+`g++ --version` + the source of the emitter, validator and IR normalization) and laid out as CACHE_DIR/sha256/<first 2 hex>/<rest>.{cpp,bin,map.json}.
+Writes go through a temp file in CACHE_DIR/.tmp followed by os.replace, so readers never see
+a partial entry. Only successful compiles are stored.
+
+Also owns the g++ command line, since its flags are part of the key. ccache is used as a
+compiler launcher when installed, with its store under CACHE_DIR/ccache unless CCACHE_DIR is set.
+
+Environment:
+- COMPILE_CACHE_DIR: cache root (default ~/.cache/graph-compiler)
+- COMPILE_CACHE=0: disable lookups and stores
+- COMPILE_OPT_LEVEL: g++ optimization flag (default -O1; use -O2 for correctness-sensitive runs)
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+CACHE_DIR = Path(os.environ.get('COMPILE_CACHE_DIR', str(Path.home() / '.cache' / 'graph-compiler')))
+ENABLED = os.environ.get('COMPILE_CACHE', '1') != '0'
+_SUFFIXES = ('.cpp', '.bin', '.map.json')
+# emitted programs are small and compile time dominates, so -O1 rather than -O2 by default
+GPP_FLAGS = ('-std=c++17', os.environ.get('COMPILE_OPT_LEVEL', '-O1'), '-pipe', '-fno-plt')
+_CCACHE = shutil.which('ccache')
+
+
+# modules whose code decides what gets emitted; editing any of them invalidates every entry
+_PROJECT_DIR = Path(__file__).resolve().parents[1]
+_EMITTER_SOURCES = ('compiler/cpp_emitter.py', 'compiler/validator.py', 'scripts/emit_and_compile.py')
+
+
+@functools.lru_cache(maxsize=1)
+def _emitter_id() -> bytes:
+    h = hashlib.sha256()
+    for name in _EMITTER_SOURCES:
+        try:
+            h.update((_PROJECT_DIR / name).read_bytes())
+        except OSError:
+            h.update(b'missing:' + name.encode())
+    return h.digest()
+
+
+@functools.lru_cache(maxsize=1)
+def _toolchain_id() -> bytes:
+    try:
+        return subprocess.check_output(['g++', '--version'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return b''
+
+
+def gpp_command(out_bin, cpp_path, flags: Sequence[str] = GPP_FLAGS):
+    """g++ command line for compiling cpp_path, launched through ccache when it is installed."""
+    launcher = [_CCACHE] if _CCACHE else []
+    return [*launcher, 'g++', *flags, '-o', str(out_bin), str(cpp_path)]
+
+
+def gpp_env() -> Dict[str, str]:
+    """Environment for gpp_command(): keeps ccache's store next to the artifact cache."""
+    env = dict(os.environ)
+    env.setdefault('CCACHE_DIR', str(CACHE_DIR / 'ccache'))
+    return env
+
+
+def cache_key(ir: Dict[str, Any], node_defs: Dict[str, Any], flags: Sequence[str] = (), pipeline: str = '') -> str:
+    """Key for compiling ir, which must be exactly the IR handed to CppEmitter.
+
+    pipeline names the tool that produced the entry, so tools that prepare the IR differently
+    (emit_and_compile normalizes it, compile_service does not) never serve each other's output.
+    """
+    h = hashlib.sha256(pipeline.encode() + b'\0')
+    h.update(json.dumps(ir, sort_keys=True).encode())
+    h.update(json.dumps(node_defs or {}, sort_keys=True).encode())
+    h.update(' '.join(flags).encode())
+    h.update(_toolchain_id())
+    h.update(_emitter_id())
+    return h.hexdigest()
+
+
+def _entry_base(key: str) -> Path:
+    return CACHE_DIR / 'sha256' / key[:2] / key[2:]
+
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    """Return {'cpp', 'bin', 'mapping'} for a cached entry, or None on a miss."""
+    if not ENABLED:
+        return None
+    base = _entry_base(key)
+    paths = [Path(f'{base}{suffix}') for suffix in _SUFFIXES]
+    try:
+        cpp = paths[0].read_text()
+        with open(paths[2]) as f:
+            mapping = json.load(f)
+        if not paths[1].exists():
+            return None
+        # refresh mtime so gc() sees the entry as recently used (atime is unreliable on relatime/noatime mounts)
+        for p in paths:
+            os.utime(p)
+    except (OSError, ValueError):
+        return None
+    return {'cpp': cpp, 'bin': str(paths[1]), 'mapping': mapping}
+
+
+def _atomic_write(dest: Path, data: bytes, mode: Optional[int] = None):
+    tmp_dir = CACHE_DIR / '.tmp'
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as f:
+        f.write(data)
+    try:
+        if mode is not None:
+            os.chmod(f.name, mode)
+        os.replace(f.name, dest)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+def store(key: str, cpp: str, bin_path: str, mapping: Any):
+    """Cache a successful compile. Best effort: failures to write are ignored."""
+    if not ENABLED:
+        return
+    base = _entry_base(key)
+    try:
+        _atomic_write(Path(f'{base}.cpp'), cpp.encode())
+        _atomic_write(Path(f'{base}.map.json'), json.dumps(mapping).encode())
+        with open(bin_path, 'rb') as f:
+            _atomic_write(Path(f'{base}.bin'), f.read(), mode=0o755)
+    except OSError:
+        pass
+
+
+def gc(max_age_days: float = 7):
+    """Delete cache files not used within max_age_days."""
+    cutoff = time.time() - max_age_days * 86400
+    root = CACHE_DIR / 'sha256'
+    if not root.is_dir():
+        return
+    for shard in os.scandir(root):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+def start_gc_thread(interval_s: float = 3600, max_age_days: float = 7) -> threading.Thread:
+    def _loop():
+        while True:
+            gc(max_age_days)
+            time.sleep(interval_s)
+    t = threading.Thread(target=_loop, daemon=True)
+    t.start()
+    return t
@@ -4,12 +4,16 @@ Entry point for the sandbox Docker image. Expects a JSON file at /workspace/inpu
   { "ir": {...}, "node_defs": {...}, "timeout": <seconds> }
 Writes result JSON to /workspace/output.json
 
+With SANDBOX_STDIO=1 the job is read from stdin and the result written to stdout instead, so
+the host does not need to share a directory with the container.
+
 This script is intentionally minimal and uses the same emitter & validator modules.
 """
+import hashlib
 import json
 import os
+import signal
 import sys
-import shutil
 import subprocess
 from pathlib import Path
 
@@ -18,85 +22,196 @@ sys.path.append(str(Path(__file__).resolve().parents[1] / 'compiler'))
 from cpp_emitter import CppEmitter
 from validator import topological_sort, validate_types, ValidationError
 
-WORKDIR = '/workspace'
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used when orjson is not installed
+    orjson = None
+
+
+def _json_bytes(obj, indent=False, sort_keys=False):
+    if orjson is not None:
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys).encode()
+
+
+def jloads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def jload(path):
+    return jloads(Path(path).read_bytes())
+
+
+def jdump(path, obj, indent=False):
+    Path(path).write_bytes(_json_bytes(obj, indent=indent))
+
+# overridable so one long-lived container can serve several workspaces (see ci_run_tests.py)
+WORKDIR = os.environ.get('SANDBOX_WORKDIR', '/workspace')
 INPUT = os.path.join(WORKDIR, 'input.json')
 OUTPUT = os.path.join(WORKDIR, 'output.json')
+STDIO = os.environ.get('SANDBOX_STDIO') == '1'
+# files compile_ir_to_bin writes into its tmpdir
+_TMP_ARTIFACTS = frozenset(('out.cpp', 'out_bin', 'cc.stdout', 'cc.stderr', 'run.stdout', 'run.stderr'))
 
 
 def write_output(obj):
     try:
-        with open(OUTPUT, 'w') as f:
-            json.dump(obj, f, indent=2)
+        if STDIO:
+            sys.stdout.buffer.write(_json_bytes(obj))
+            sys.stdout.flush()
+            return
+        jdump(OUTPUT, obj, indent=True)
     except Exception as e:
-        print('Failed to write output.json:', e, file=sys.stderr)
+        print('Failed to write output:', e, file=sys.stderr)
+
+
+def _validation_key(ir, node_defs):
+    h = hashlib.blake2b(_json_bytes(ir, sort_keys=True))
+    h.update(_json_bytes(node_defs, sort_keys=True))
+    return h.hexdigest()
+
+
+def _read_text(path):
+    with open(path, errors='replace') as f:
+        return f.read()
+
+
+def _kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _run_to_files(cmd, out_path, err_path, timeout=None):
+    # Python opens descriptors non-inheritable (PEP 446), so close_fds=False leaks nothing to the
+    # child and skips subprocess's per-spawn sweep over the fd table.
+    # The child leads its own process group, and the whole group is killed once it exits or times
+    # out, so anything it forked into the background can't outlive it into the next job.
+    with open(out_path, 'w') as o, open(err_path, 'w') as e:
+        proc = subprocess.Popen(cmd, stdout=o, stderr=e, close_fds=False, pass_fds=(), start_new_session=True)
+        try:
+            return proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc.pid)
+            proc.wait()
+            raise
+        finally:
+            _kill_group(proc.pid)
 
 
 def compile_ir_to_bin(ir, node_defs, tmpdir, timeout=5):
     # emit
     emitter = CppEmitter(ir, node_defs)
     cpp = emitter.emit()
-    mapping = getattr(emitter, 'mapping', [])
+    mapping = emitter.mapping
     cpp_path = os.path.join(tmpdir, 'out.cpp')
     bin_path = os.path.join(tmpdir, 'out_bin')
     with open(cpp_path, 'w') as f:
         f.write(cpp)
-    # compile
-    cmd = ['g++', '-std=c++17', '-O2', '-o', bin_path, cpp_path]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if proc.returncode != 0:
-        return { 'success': False, 'error': 'compile', 'stderr': proc.stderr, 'stdout': proc.stdout, 'mapping': mapping, 'cpp': cpp }
+    # compile; compiler output goes straight to files and is only read back on failure
+    cmd = ['g++', '-std=c++17', os.environ.get('COMPILE_OPT_LEVEL', '-O1'), '-pipe', '-fno-plt']
+    if os.environ.get('SANDBOX_LTO') == '1':
+        cmd.append('-flto')
+    cmd += ['-o', bin_path, cpp_path]
+    cc_out = os.path.join(tmpdir, 'cc.stdout')
+    cc_err = os.path.join(tmpdir, 'cc.stderr')
+    if _run_to_files(cmd, cc_out, cc_err) != 0:
+        return { 'success': False, 'error': 'compile', 'stderr': _read_text(cc_err), 'stdout': _read_text(cc_out), 'mapping': mapping, 'cpp': cpp }
     # run
+    run_out = os.path.join(tmpdir, 'run.stdout')
+    run_err = os.path.join(tmpdir, 'run.stderr')
     try:
-        proc = subprocess.run([bin_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        _run_to_files([bin_path], run_out, run_err, timeout=timeout)
     except subprocess.TimeoutExpired:
         return { 'success': False, 'error': 'timeout', 'message': 'Execution timed out', 'mapping': mapping, 'cpp': cpp }
-    return { 'success': True, 'stdout': proc.stdout, 'stderr': proc.stderr, 'mapping': mapping, 'cpp': cpp }
+    return { 'success': True, 'stdout': _read_text(run_out), 'stderr': _read_text(run_err), 'mapping': mapping, 'cpp': cpp }
+
+def _clear_tmpdir(tmpdir):
+    # the temp dir is reused across runs, so only the files a previous compile left behind are removed
+    if os.path.isdir(tmpdir):
+        for entry in os.scandir(tmpdir):
+            if entry.name in _TMP_ARTIFACTS:
+                os.unlink(entry.path)
+    else:
+        os.makedirs(tmpdir)
+
+
+def run_job(job, tmpdir, validated=None):
+    """Validate, compile and run one {ir, node_defs, timeout} job; returns its result dict.
+
+    validated, if given, is a set of _validation_key()s that already passed in this process;
+    a job whose key is in it skips validation, and passing jobs are added to it.
+    """
+    ir = job.get('ir')
+    node_defs = job.get('node_defs', {})
+    timeout = int(job.get('timeout', 5))
+    if not ir:
+        return { 'success': False, 'error': 'no_ir' }
+
+    # validate (skipped when this exact IR/node_defs pair already passed earlier in the batch)
+    key = _validation_key(ir, node_defs) if validated is not None else None
+    if key is None or key not in validated:
+        try:
+            nodes = ir.get('nodes', [])
+            edges = ir.get('edges', [])
+            topological_sort(nodes, edges)
+            if node_defs:
+                validate_types(nodes, node_defs, edges)
+        except ValidationError as e:
+            return { 'success': False, 'error': 'validation', 'message': str(e) }
+        if key is not None:
+            validated.add(key)
+
+    # compile & run
+    try:
+        return compile_ir_to_bin(ir, node_defs, tmpdir, timeout=timeout)
+    except Exception as e:
+        return { 'success': False, 'error': 'exception', 'message': str(e) }
 
 
 def main():
-    if not os.path.exists(INPUT):
+    if not STDIO and not os.path.exists(INPUT):
         write_output({ 'success': False, 'error': 'no_input', 'message': f'Missing {INPUT}' })
         sys.exit(1)
     try:
-        data = json.load(open(INPUT))
+        data = jloads(sys.stdin.buffer.read()) if STDIO else jload(INPUT)
     except Exception as e:
         write_output({ 'success': False, 'error': 'invalid_json', 'message': str(e) })
         sys.exit(1)
-    ir = data.get('ir')
-    node_defs = data.get('node_defs', {})
-    timeout = int(data.get('timeout', 5))
-    if not ir:
+    # batched input ({"jobs": [...]}) runs every job in turn and writes {"results": [...]}
+    jobs = data.get('jobs')
+    if jobs is None and not data.get('ir'):
         write_output({ 'success': False, 'error': 'no_ir' })
         sys.exit(1)
 
     # prepare temp dir within workspace
     tmpdir = os.path.join(WORKDIR, 'tmp')
     try:
-        if os.path.exists(tmpdir):
-            shutil.rmtree(tmpdir)
-        os.makedirs(tmpdir, exist_ok=True)
+        _clear_tmpdir(tmpdir)
     except Exception as e:
         write_output({ 'success': False, 'error': 'tmpdir', 'message': str(e) })
         sys.exit(1)
 
-    # validate
-    try:
-        nodes = ir.get('nodes', [])
-        edges = ir.get('edges', [])
-        topological_sort(nodes, edges)
-        if node_defs:
-            validate_types(nodes, node_defs, edges)
-    except ValidationError as e:
-        write_output({ 'success': False, 'error': 'validation', 'message': str(e) })
-        sys.exit(0)
-
-    # compile & run
-    try:
-        result = compile_ir_to_bin(ir, node_defs, tmpdir, timeout=timeout)
-    except Exception as e:
-        result = { 'success': False, 'error': 'exception', 'message': str(e) }
+    if jobs is None:
+        write_output(run_job(data, tmpdir))
+        return
+    results = []
+    # kept in memory only, so it spans just this batch; nothing a job's program writes can mark
+    # an IR as validated
+    validated = set()
+    for idx, job in enumerate(jobs):
+        # batched jobs may come from different clients, so each gets a directory of its own
+        job_dir = os.path.join(tmpdir, f'job{idx}')
+        try:
+            _clear_tmpdir(job_dir)
+        except Exception as e:
+            results.append({ 'success': False, 'error': 'tmpdir', 'message': str(e) })
+            continue
+        results.append(run_job(job, job_dir, validated))
+    write_output({ 'success': True, 'results': results })
 
-    write_output(result)
 
 if __name__ == '__main__':
     main()
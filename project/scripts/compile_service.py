@@ -7,33 +7,59 @@ POST /compile
 
 Response: JSON from container output.json or error message.
 
+POST /compile_batch
+  JSON body: { "jobs": [ <compile body>, ... ] }  ->  { "success": true, "results": [...] }
+
+With BATCH_WINDOW_MS > 0 (default 0, off), concurrent /compile requests arriving within that
+window are coalesced into a single sandbox run of up to BATCH_MAX jobs; /compile_batch accepts at
+most BATCH_MAX jobs. Per-job run timeouts are capped at DOCKER_TIMEOUT. Tiny IRs (at most
+INTERP_THRESHOLD nodes, default 4, of the types interp.py supports) are evaluated in-process instead.
+
 Notes:
 - This service requires Docker installed on the host and the sandbox image built (see docker/sandbox/Dockerfile).
 - The image name expected: graph-compiler-sandbox
-- Docker is invoked via project/scripts/docker_runner.py which enforces resource limits and disables network.
+- Docker is invoked via project/scripts/docker_runner.py (imported, not spawned) which enforces resource limits and disables network.
+- Running this file starts the Flask dev server; serve_compile_service.py runs the app under waitress.
 
 Behavior change: For safety, the in-process (unsafe) fallback is disabled by default. To enable it for local development set environment variable DEV_ALLOW_FALLBACK=1.
 If a DEV_FALLBACK_TOKEN is configured, requests must include header X-DEV-FALLBACK-TOKEN with that value to use the fallback. Additionally, fallback is only permitted from localhost unless a token is used.
 """
-import json
+import atexit
+import functools
+import hmac
+import itertools
 import os
+import queue
 import tempfile
 import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 
 # Local modules
 import sys
 sys.path.append(str(Path(__file__).resolve().parents[1] / 'compiler'))
 from cpp_emitter import CppEmitter
 from validator import topological_sort, validate_types, ValidationError
+from docker_runner import SandboxPool, run_stdio as docker_run_stdio
+import compile_cache
+import interp
+from jsonio import json_bytes, jloads, jload
 
 app = Flask(__name__)
+# request bodies over this size are rejected with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_IR_BYTES', str(16 * 1024 * 1024)))
 
 SANDBOX_IMAGE = os.environ.get('SANDBOX_IMAGE', 'graph-compiler-sandbox')
 DOCKER_TIMEOUT = int(os.environ.get('DOCKER_TIMEOUT', '15'))
-DOCKER_RUNNER = Path(__file__).resolve().parents[0] / 'docker_runner.py'
+SANDBOX_MEMORY = os.environ.get('SANDBOX_MEMORY', '256m')
+SANDBOX_CPUS = os.environ.get('SANDBOX_CPUS', '0.5')
+SANDBOX_PIDS_LIMIT = int(os.environ.get('SANDBOX_PIDS_LIMIT', '64'))
+# operator-supplied seccomp profile
+SANDBOX_SECCOMP = os.environ.get('SANDBOX_SECCOMP')
 DEV_ALLOW_FALLBACK = os.environ.get('DEV_ALLOW_FALLBACK', '0') == '1'
 DEV_FALLBACK_TOKEN = os.environ.get('DEV_FALLBACK_TOKEN')
 ALLOWED_INCLUDES_PATH = Path(__file__).resolve().parents[1] / 'compiler' / 'allowed_includes.json'
@@ -45,215 +71,423 @@ if DEV_ALLOW_FALLBACK:
     _fallback_force = os.environ.get('DEV_FALLBACK_FORCE', '0') == '1'
     if not DEV_FALLBACK_TOKEN and not _fallback_force:
         print("ERROR: DEV_ALLOW_FALLBACK=1 is set but no DEV_FALLBACK_TOKEN configured and DEV_FALLBACK_FORCE!=1.", file=sys.stderr)
-        print("For safety, the service will not start with in-process fallback enabled.
-", file=sys.stderr)
+        print("For safety, the service will not start with in-process fallback enabled.", file=sys.stderr)
         print("To enable for local development: set DEV_ALLOW_FALLBACK=1 and set DEV_FALLBACK_TOKEN to a strong value, or set DEV_FALLBACK_FORCE=1 to acknowledge the risk.", file=sys.stderr)
         sys.exit(1)
     else:
         print(f"WARNING: DEV in-process fallback is enabled. Token present: {bool(DEV_FALLBACK_TOKEN)}; force={_fallback_force}. In-process fallback is gated and should NOT be used in production.", file=sys.stderr)
 DEFAULT_NODE_DEFS = Path(__file__).resolve().parents[1] / 'compiler' / 'node_defs.json'
 
-# load allowlist once
-try:
-    if ALLOWED_INCLUDES_PATH.exists():
-        _ALLOWED_INCLUDES = set(json.load(open(ALLOWED_INCLUDES_PATH)))
-    else:
-        _ALLOWED_INCLUDES = set()
-except Exception:
-    _ALLOWED_INCLUDES = set()
+# Optional pool of warm sandbox containers (SANDBOX_POOL_SIZE > 0); jobs that find no idle
+# container fall back to a fresh one via docker_runner.run_stdio
+SANDBOX_POOL_SIZE = int(os.environ.get('SANDBOX_POOL_SIZE', '0'))
+_SANDBOX_POOL = None
+if SANDBOX_POOL_SIZE > 0:
+    _SANDBOX_POOL = SandboxPool(
+        SANDBOX_IMAGE, SANDBOX_POOL_SIZE,
+        memory=SANDBOX_MEMORY,
+        cpus=SANDBOX_CPUS,
+        pids_limit=SANDBOX_PIDS_LIMIT,
+        seccomp=SANDBOX_SECCOMP,
+        recycle_after=int(os.environ.get('SANDBOX_POOL_RECYCLE', '50')),
+    )
+    atexit.register(_SANDBOX_POOL.close)
 
+# the artifact cache is only used by the in-process fallback
+if DEV_ALLOW_FALLBACK and compile_cache.ENABLED:
+    compile_cache.start_gc_thread()
 
-def _collect_includes_from_ir(ir: dict, node_defs: dict) -> set:
-    includes = set()
-    for inc in ir.get('imports', []) or []:
-        includes.add(inc)
-    # nodes
-    for n in ir.get('nodes', []) or []:
-        ntype = n.get('type')
-        ddef = (node_defs or {}).get(ntype)
-        if not ddef:
-            # try to load from default node_defs file
+# Scratch space for the in-process fallback: one root per process and a numbered subdir per
+# request, emptied with scandir/unlink. Point COMPILE_TMPDIR at a tmpfs mounted with exec
+# (the compiled binary runs from it) to keep this off disk.
+COMPILE_TMPDIR = os.environ.get('COMPILE_TMPDIR')
+SCRATCH_MAX_AGE = int(os.environ.get('SCRATCH_MAX_AGE', '600'))
+_WORK_ROOT = None
+_work_counter = itertools.count()
+_work_lock = threading.Lock()
+
+
+def _scratch_dir() -> str:
+    global _WORK_ROOT
+    with _work_lock:
+        if _WORK_ROOT is None:
+            _WORK_ROOT = tempfile.mkdtemp(prefix='compile_service_worker_', dir=COMPILE_TMPDIR)
+            atexit.register(shutil.rmtree, _WORK_ROOT, ignore_errors=True)
+            threading.Thread(target=_trim_scratch_loop, daemon=True).start()
+        path = os.path.join(_WORK_ROOT, str(next(_work_counter)))
+    os.mkdir(path)
+    return path
+
+
+def _clear_scratch(path: str):
+    # scratch dirs are flat (out.cpp, out_bin), so no recursive walk is needed
+    try:
+        for entry in os.scandir(path):
+            os.unlink(entry.path)
+        os.rmdir(path)
+    except OSError:
+        pass
+
+
+def _trim_scratch_loop():
+    # removes dirs a request failed to clean up (e.g. killed mid-compile)
+    while True:
+        time.sleep(SCRATCH_MAX_AGE)
+        cutoff = time.time() - SCRATCH_MAX_AGE
+        for entry in os.scandir(_WORK_ROOT):
             try:
-                default_defs = json.load(open(DEFAULT_NODE_DEFS))
-                ddef = default_defs.get(ntype)
-            except Exception:
-                ddef = None
-        if ddef:
-            lib = ddef.get('lib')
-            if lib:
-                inc = lib.get('include')
-                if inc:
-                    includes.add(inc)
-    # functions: inspect their graphs recursively
-    for f in ir.get('functions', []) or []:
-        g = f.get('graph', {})
-        for n in g.get('nodes', []) or []:
+                if entry.stat().st_mtime < cutoff:
+                    _clear_scratch(entry.path)
+            except OSError:
+                pass
+
+# load allowlist once; a malformed file fails startup rather than silently allowing every include
+_ALLOWED_INCLUDES = set(jload(ALLOWED_INCLUDES_PATH)) if ALLOWED_INCLUDES_PATH.exists() else set()
+
+
+def _read_default_node_defs() -> dict:
+    try:
+        return jload(DEFAULT_NODE_DEFS) if DEFAULT_NODE_DEFS.exists() else {}
+    except Exception:
+        return {}
+
+
+# load default node_defs once; NODE_DEFS_RELOAD=1 re-reads the file when its mtime changes (dev only)
+NODE_DEFS_RELOAD = os.environ.get('NODE_DEFS_RELOAD', '0') == '1'
+_DEFAULT_NODE_DEFS = _read_default_node_defs()
+_DEFAULT_NODE_DEFS_MTIME = DEFAULT_NODE_DEFS.stat().st_mtime if DEFAULT_NODE_DEFS.exists() else None
+
+
+def _default_node_defs() -> dict:
+    global _DEFAULT_NODE_DEFS, _DEFAULT_NODE_DEFS_MTIME
+    if NODE_DEFS_RELOAD:
+        mtime = DEFAULT_NODE_DEFS.stat().st_mtime if DEFAULT_NODE_DEFS.exists() else None
+        if mtime != _DEFAULT_NODE_DEFS_MTIME:
+            _DEFAULT_NODE_DEFS = _read_default_node_defs()
+            _DEFAULT_NODE_DEFS_MTIME = mtime
+    return _DEFAULT_NODE_DEFS
+
+
+def _walk_nodes(ir: dict, node_defs: dict, default_defs: dict):
+    """Yield (node, ddef) for the top-level nodes, then the nodes of each function graph.
+
+    Supplied defs win; the defaults cover types they don't define.
+    """
+    graphs = [ir.get('nodes', []) or []]
+    graphs += [f.get('graph', {}).get('nodes', []) or [] for f in ir.get('functions', []) or []]
+    for nodes in graphs:
+        for n in nodes:
             ntype = n.get('type')
-            ddef = (node_defs or {}).get(ntype)
-            if not ddef:
-                try:
-                    default_defs = json.load(open(DEFAULT_NODE_DEFS))
-                    ddef = default_defs.get(ntype)
-                except Exception:
-                    ddef = None
-            if ddef:
-                lib = ddef.get('lib')
-                if lib:
-                    inc = lib.get('include')
-                    if inc:
-                        includes.add(inc)
+            yield n, node_defs.get(ntype) or default_defs.get(ntype)
+
+
+def _collect_includes_from_ir(ir: dict, node_defs: dict) -> set:
+    includes = set(ir.get('imports', []) or [])
+    for _, ddef in _walk_nodes(ir, node_defs or {}, _default_node_defs()):
+        inc = ((ddef or {}).get('lib') or {}).get('include')
+        if inc:
+            includes.add(inc)
     return includes
 
 
-def run_with_docker_runner(input_dir: str, timeout: int = 15) -> dict:
-    """Run the docker_runner wrapper script which handles docker invocation with strict flags.
-    Returns parsed JSON output from docker_runner.
+def run_with_docker_runner(payload: dict, timeout: int = 15) -> dict:
+    """Run a sandbox job through docker_runner, which handles docker invocation with strict flags.
+    The payload is piped to the container, so nothing is written on the host. Returns the result
+    dict. Uses an idle warm container first when the sandbox pool is enabled.
     """
-    cmd = [sys.executable, str(DOCKER_RUNNER), '--input-dir', input_dir, '--image', SANDBOX_IMAGE, '--timeout', str(timeout)]
-    # allow operator to pass seccomp profile via env
-    seccomp = os.environ.get('SANDBOX_SECCOMP')
-    if seccomp:
-        cmd += ['--seccomp', seccomp]
-    try:
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout+5)
-    except subprocess.TimeoutExpired:
-        return { 'success': False, 'error': 'runner_timeout', 'message': 'docker_runner timed out' }
-    if proc.returncode != 0:
-        # docker_runner prints JSON on failure as well; try to parse
-        try:
-            return json.loads(proc.stdout)
-        except Exception:
-            return { 'success': False, 'error': 'runner_failed', 'message': proc.stderr or proc.stdout }
-    try:
-        return json.loads(proc.stdout)
-    except Exception as e:
-        return { 'success': False, 'error': 'bad_runner_output', 'message': str(e), 'stdout': proc.stdout, 'stderr': proc.stderr }
+    if _SANDBOX_POOL is not None:
+        pooled = _SANDBOX_POOL.run(payload, timeout=timeout)
+        if pooled is not None:
+            return pooled
+    return docker_run_stdio(
+        payload, SANDBOX_IMAGE, timeout=timeout,
+        memory=SANDBOX_MEMORY, cpus=SANDBOX_CPUS, pids_limit=SANDBOX_PIDS_LIMIT, seccomp=SANDBOX_SECCOMP,
+    )
+
 
+def _validate(ir: dict, node_defs: dict):
+    """Topology and (when node_defs are given) type checks; raises ValidationError."""
+    nodes = ir.get('nodes', [])
+    edges = ir.get('edges', [])
+    topological_sort(nodes, edges)
+    if node_defs:
+        validate_types(nodes, node_defs, edges)
 
-def compile_in_process(ir: dict, node_defs: dict = None, timeout: int = 5) -> dict:
-    """Unsafe fallback: compile and run inside this process (not recommended for untrusted input)."""
+
+def compile_in_process(ir: dict, node_defs: dict = None, timeout: int = 5, skip_validation: bool = False) -> dict:
+    """Unsafe fallback: compile and run inside this process (not recommended for untrusted input).
+
+    skip_validation=True is for jobs that already passed _prepare_job.
+    """
     node_defs = node_defs or {}
-    try:
-        nodes = ir.get('nodes', [])
-        edges = ir.get('edges', [])
-        topological_sort(nodes, edges)
-        if node_defs:
-            validate_types(nodes, node_defs, edges)
-    except ValidationError as e:
-        return { 'success': False, 'error': 'validation', 'message': str(e) }
+    if not skip_validation:
+        try:
+            _validate(ir, node_defs)
+        except ValidationError as e:
+            return { 'success': False, 'error': 'validation', 'message': str(e) }
 
-    emitter = CppEmitter(ir, node_defs)
-    cpp = emitter.emit()
-    mapping = getattr(emitter, 'mapping', [])
+    # content-addressed artifact cache: on a hit, skip emit and g++ and run the cached binary
+    key = compile_cache.cache_key(ir, node_defs, compile_cache.GPP_FLAGS, pipeline='compile_service')
+    cached = compile_cache.lookup(key)
 
-    tmpdir = tempfile.mkdtemp(prefix='compile_fallback_')
+    tmpdir = None
     try:
-        cpp_path = os.path.join(tmpdir, 'out.cpp')
-        bin_path = os.path.join(tmpdir, 'out_bin')
-        with open(cpp_path, 'w') as f:
-            f.write(cpp)
-        cmd = ['g++', '-std=c++17', '-O2', '-o', bin_path, cpp_path]
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if proc.returncode != 0:
-            return { 'success': False, 'error': 'compile', 'stderr': proc.stderr, 'stdout': proc.stdout, 'mapping': mapping, 'cpp': cpp }
+        if cached:
+            cpp, mapping, bin_path = cached['cpp'], cached['mapping'], cached['bin']
+        else:
+            tmpdir = _scratch_dir()
+            emitter = CppEmitter(ir, node_defs)
+            cpp = emitter.emit()
+            mapping = emitter.mapping
+            cpp_path = os.path.join(tmpdir, 'out.cpp')
+            bin_path = os.path.join(tmpdir, 'out_bin')
+            with open(cpp_path, 'w') as f:
+                f.write(cpp)
+            cmd = compile_cache.gpp_command(bin_path, cpp_path)
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=compile_cache.gpp_env())
+            if proc.returncode != 0:
+                return { 'success': False, 'error': 'compile', 'stderr': proc.stderr, 'stdout': proc.stdout, 'mapping': mapping, 'cpp': cpp }
+            compile_cache.store(key, cpp, bin_path, mapping)
         proc = subprocess.run([bin_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
         return { 'success': True, 'stdout': proc.stdout, 'stderr': proc.stderr, 'mapping': mapping, 'cpp': cpp }
     except subprocess.TimeoutExpired:
         return { 'success': False, 'error': 'timeout', 'message': 'Execution timed out', 'mapping': mapping, 'cpp': cpp }
     finally:
-        try:
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
+        if tmpdir:
+            _clear_scratch(tmpdir)
 
 
-@app.route('/compile', methods=['POST'])
-def compile_endpoint():
-    payload = request.get_json()
-    if not payload:
-        return jsonify({ 'success': False, 'error': 'no_json' }), 400
+def _prepare_job(payload: dict):
+    """Check one {ir, node_defs, timeout} payload before it is scheduled on the sandbox.
+
+    Returns (job, None) with node_defs defaulted, or (None, (error_body, status)).
+    """
     ir = payload.get('ir')
     node_defs = payload.get('node_defs', {})
-    timeout = int(payload.get('timeout', 5))
+    try:
+        timeout = int(payload.get('timeout', 5))
+    except (TypeError, ValueError):
+        return None, ({ 'success': False, 'error': 'bad_timeout', 'message': 'timeout must be an integer number of seconds' }, 400)
+    # the client's run timeout can't exceed the sandbox's own budget for a single job
+    timeout = max(1, min(timeout, DOCKER_TIMEOUT))
     if not ir:
-        return jsonify({ 'success': False, 'error': 'no_ir' }), 400
+        return None, ({ 'success': False, 'error': 'no_ir' }, 400)
 
-    # validate includes against allowlist before starting expensive steps
+    # validate includes against allowlist before starting expensive steps; without an
+    # allowlist nothing can be disallowed, so the node walk is skipped
     try:
-        includes = _collect_includes_from_ir(ir, node_defs)
-        disallowed = [inc for inc in includes if _ALLOWED_INCLUDES and inc not in _ALLOWED_INCLUDES]
+        includes = _collect_includes_from_ir(ir, node_defs) if _ALLOWED_INCLUDES else ()
+        disallowed = [inc for inc in includes if inc not in _ALLOWED_INCLUDES]
         if disallowed:
-            return jsonify({ 'success': False, 'error': 'disallowed_includes', 'message': f'Includes not allowed: {disallowed}', 'allowed': sorted(list(_ALLOWED_INCLUDES)) }), 400
+            return None, ({ 'success': False, 'error': 'disallowed_includes', 'message': f'Includes not allowed: {disallowed}', 'allowed': sorted(list(_ALLOWED_INCLUDES)) }, 400)
     except Exception as e:
         # non-fatal: proceed but log (we'll return an error)
-        return jsonify({ 'success': False, 'error': 'include_check_failed', 'message': str(e) }), 400
+        return None, ({ 'success': False, 'error': 'include_check_failed', 'message': str(e) }, 400)
 
     # Perform IR validation (topology & types) before scheduling the sandbox run
     try:
-        nodes = ir.get('nodes', [])
-        edges = ir.get('edges', [])
-        # load default node_defs if not provided
-        if not node_defs and DEFAULT_NODE_DEFS.exists():
-            try:
-                node_defs = json.load(open(DEFAULT_NODE_DEFS))
-            except Exception:
-                node_defs = {}
-        # run validator
-        topological_sort(nodes, edges)
-        if node_defs:
-            validate_types(nodes, node_defs, edges)
+        # use the default node_defs if not provided
+        if not node_defs:
+            node_defs = _default_node_defs()
+        _validate(ir, node_defs)
     except ValidationError as e:
-        return jsonify({ 'success': False, 'error': 'validation', 'message': str(e) }), 400
+        return None, ({ 'success': False, 'error': 'validation', 'message': str(e) }, 400)
     except Exception as e:
-        return jsonify({ 'success': False, 'error': 'validation_error', 'message': str(e) }), 400
+        return None, ({ 'success': False, 'error': 'validation_error', 'message': str(e) }, 400)
+    return { 'ir': ir, 'node_defs': node_defs, 'timeout': timeout }, None
+
+
+def _run_batch(jobs: list, retry_alone: bool = False) -> list:
+    """Run several jobs in one sandbox invocation; returns one result per job.
 
-    # create workspace
-    tmpdir = tempfile.mkdtemp(prefix='compile_service_')
+    A sandbox-level failure (docker unavailable, timeout, out of memory, ...) is reported for
+    every job, unless retry_alone is set: then each job of a failed multi-job batch is re-run in a
+    sandbox of its own, so one job exhausting the container doesn't fail the others.
+    """
+    # sandboxed execution via docker_runner; the budget grows with each extra job's own run
+    # timeout (each already capped at DOCKER_TIMEOUT by _prepare_job), up to BATCH_TIMEOUT
     try:
-        input_path = os.path.join(tmpdir, 'input.json')
-        with open(input_path, 'w') as f:
-            json.dump({ 'ir': ir, 'node_defs': node_defs, 'timeout': timeout }, f)
+        timeout = min(DOCKER_TIMEOUT + sum(j['timeout'] for j in jobs[1:]), max(BATCH_TIMEOUT, DOCKER_TIMEOUT))
+        docker_result = run_with_docker_runner({ 'jobs': jobs }, timeout=timeout)
+    except Exception as e:
+        docker_result = { 'success': False, 'error': 'runner_exception', 'message': str(e) }
 
-        # Prefer using the docker_runner wrapper for sandboxed execution
-        if DOCKER_RUNNER.exists():
-            try:
-                docker_result = run_with_docker_runner(tmpdir, timeout=DOCKER_TIMEOUT)
-            except Exception as e:
-                docker_result = { 'success': False, 'error': 'runner_exception', 'message': str(e) }
-        else:
-            docker_result = { 'success': False, 'error': 'runner_missing', 'message': 'docker_runner.py not found' }
-
-        if docker_result.get('success'):
-            return jsonify(docker_result), 200
-
-        # If docker failed, only allow unsafe fallback when DEV_ALLOW_FALLBACK is enabled and permitted
-        if DEV_ALLOW_FALLBACK:
-            # Restrict fallback to localhost requests unless a fallback token is configured
-            remote = request.remote_addr
-            if DEV_FALLBACK_TOKEN:
-                header = request.headers.get('X-DEV-FALLBACK-TOKEN')
-                if header != DEV_FALLBACK_TOKEN:
-                    return jsonify({ 'success': False, 'error': 'fallback_forbidden', 'message': 'Invalid or missing DEV_FALLBACK_TOKEN header' }), 403
-            else:
-                if remote not in ('127.0.0.1', '::1', 'localhost'):
-                    return jsonify({ 'success': False, 'error': 'fallback_forbidden', 'message': 'In-process fallback only allowed from localhost' }), 403
-
-            fallback = compile_in_process(ir, node_defs, timeout)
-            fallback['fallback_executed'] = True
-            fallback['docker_error'] = docker_result
-            status = 200 if fallback.get('success') else 400
-            return jsonify(fallback), status
-
-        # Otherwise, return docker error and advise enabling sandbox
-        return jsonify({ 'success': False, 'error': 'sandbox_unavailable', 'message': 'Sandbox unavailable. Ensure Docker image is built and docker is accessible.', 'details': docker_result }), 503
+    results = docker_result.get('results') if isinstance(docker_result, dict) else None
+    if isinstance(results, list) and len(results) == len(jobs):
+        return results
+    if docker_result.get('success'):
+        docker_result = { 'success': False, 'error': 'bad_batch_output', 'message': 'Sandbox returned no per-job results', 'details': docker_result }
+    if retry_alone and len(jobs) > 1:
+        return [_run_batch([job])[0] for job in jobs]
+    return [docker_result] * len(jobs)
 
-    finally:
+
+class _Coalescer:
+    """Merges /compile requests arriving within a short window into one sandbox run.
+
+    Each caller blocks on its own Event until its slice of the batch result is ready. Batches
+    are dispatched on a small thread pool so a slow batch doesn't hold up the next window.
+    """
+
+    def __init__(self, window_ms: int, max_jobs: int, workers: int):
+        self.window = window_ms / 1000.0
+        self.max_jobs = max_jobs
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def submit(self, job: dict) -> dict:
+        slot = {}
+        done = threading.Event()
+        self._queue.put((job, slot, done))
+        done.wait()
+        return slot['result']
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_jobs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    @staticmethod
+    def _dispatch(batch):
         try:
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
+            # coalesced jobs come from unrelated clients, so a failed sandbox run is retried per job
+            results = _run_batch([job for job, _, _ in batch], retry_alone=True)
+        except Exception as e:
+            results = [{ 'success': False, 'error': 'runner_exception', 'message': str(e) }] * len(batch)
+        for (_, slot, done), result in zip(batch, results):
+            slot['result'] = result
+            done.set()
+
+
+# IRs with at most this many nodes, all of types interp.py can evaluate, are answered without
+# g++ or the sandbox (0 disables)
+INTERP_THRESHOLD = int(os.environ.get('INTERP_THRESHOLD', '4'))
+
+
+@functools.lru_cache(maxsize=256)
+def _emit_for_mapping(ir_json: bytes, node_defs_json: bytes) -> tuple:
+    emitter = CppEmitter(jloads(ir_json), jloads(node_defs_json))
+    cpp = emitter.emit()
+    return cpp, emitter.mapping
+
+
+def _interpret(job: dict):
+    """Result dict for a tiny validated IR evaluated in-process, or None to compile it."""
+    ir = job['ir']
+    if len(ir.get('nodes', []) or []) > INTERP_THRESHOLD or not interp.supported(ir):
+        return None
+    stdout = interp.run(ir, job['node_defs'])
+    if stdout is None:
+        return None
+    # same shape as the sandbox's result, with the emitter's cpp/mapping for editor tooling
+    cpp, mapping = _emit_for_mapping(json_bytes(ir), json_bytes(job['node_defs']))
+    return { 'success': True, 'stdout': stdout, 'stderr': '', 'mapping': mapping, 'cpp': cpp, 'interpreted': True }
+
+
+# coalescing is opt-in: it runs unrelated clients' jobs one after another in the same sandbox
+BATCH_WINDOW_MS = int(os.environ.get('BATCH_WINDOW_MS', '0'))
+BATCH_MAX = int(os.environ.get('BATCH_MAX', '16'))
+# upper bound on one sandbox run's wall time, however many jobs it carries
+BATCH_TIMEOUT = int(os.environ.get('BATCH_TIMEOUT', '60'))
+_COALESCER = _Coalescer(BATCH_WINDOW_MS, BATCH_MAX, int(os.environ.get('BATCH_WORKERS', '4'))) if BATCH_WINDOW_MS > 0 else None
+
+
+def _request_json():
+    """Parse the request body as JSON; None if it is empty or not valid JSON."""
+    # cache=False: the body is parsed once, so don't keep a second copy on the request
+    raw = request.get_data(cache=False)
+    if not raw:
+        return None
+    try:
+        return jloads(raw)
+    except ValueError:
+        return None
+
+
+def _json_response(obj) -> Response:
+    return Response(json_bytes(obj), mimetype='application/json')
+
+
+@app.route('/compile', methods=['POST'])
+def compile_endpoint():
+    payload = _request_json()
+    if not payload:
+        return _json_response({ 'success': False, 'error': 'no_json' }), 400
+    job, error = _prepare_job(payload)
+    if error:
+        return _json_response(error[0]), error[1]
+
+    interpreted = _interpret(job)
+    if interpreted is not None:
+        return _json_response(interpreted), 200
+
+    if _COALESCER is not None:
+        docker_result = _COALESCER.submit(job)
+    else:
+        docker_result = _run_batch([job])[0]
+
+    if docker_result.get('success'):
+        return _json_response(docker_result), 200
+
+    # If docker failed, only allow unsafe fallback when DEV_ALLOW_FALLBACK is enabled and permitted
+    if DEV_ALLOW_FALLBACK:
+        # Restrict fallback to localhost requests unless a fallback token is configured
+        remote = request.remote_addr
+        if DEV_FALLBACK_TOKEN:
+            header = request.headers.get('X-DEV-FALLBACK-TOKEN') or ''
+            if not hmac.compare_digest(header.encode(), DEV_FALLBACK_TOKEN.encode()):
+                return _json_response({ 'success': False, 'error': 'fallback_forbidden', 'message': 'Invalid or missing DEV_FALLBACK_TOKEN header' }), 403
+        else:
+            if remote not in ('127.0.0.1', '::1', 'localhost'):
+                return _json_response({ 'success': False, 'error': 'fallback_forbidden', 'message': 'In-process fallback only allowed from localhost' }), 403
+
+        fallback = compile_in_process(job['ir'], job['node_defs'], job['timeout'], skip_validation=True)
+        fallback['fallback_executed'] = True
+        fallback['docker_error'] = docker_result
+        status = 200 if fallback.get('success') else 400
+        return _json_response(fallback), status
+
+    # Otherwise, return docker error and advise enabling sandbox
+    return _json_response({ 'success': False, 'error': 'sandbox_unavailable', 'message': 'Sandbox unavailable. Ensure Docker image is built and docker is accessible.', 'details': docker_result }), 503
+
+
+@app.route('/compile_batch', methods=['POST'])
+def compile_batch_endpoint():
+    """POST { "jobs": [{ir, node_defs, timeout}, ...] } -> { "results": [...] } in request order.
+
+    Jobs failing the include/validation checks get their error inline; the rest share one
+    sandbox run. There is no in-process fallback for batches.
+    """
+    payload = _request_json()
+    if not payload or not isinstance(payload.get('jobs'), list):
+        return _json_response({ 'success': False, 'error': 'no_jobs' }), 400
+    if len(payload['jobs']) > BATCH_MAX:
+        return _json_response({ 'success': False, 'error': 'too_many_jobs', 'message': f'At most {BATCH_MAX} jobs per batch' }), 400
+    results = [None] * len(payload['jobs'])
+    runnable = []  # (index, job)
+    for idx, item in enumerate(payload['jobs']):
+        job, error = _prepare_job(item if isinstance(item, dict) else {})
+        if error:
+            results[idx] = error[0]
+        else:
+            runnable.append((idx, job))
+    if runnable:
+        for (idx, _), result in zip(runnable, _run_batch([job for _, job in runnable])):
+            results[idx] = result
+    return _json_response({ 'success': True, 'results': results }), 200
 
 
 if __name__ == '__main__':
     print('Compile service (docker-runner-backed). Ensure you have built the sandbox image and do not expose this endpoint publicly without additional protections.')
-    app.run(host='127.0.0.1', port=5001, debug=True)
+    # dev server only; use serve_compile_service.py for a production WSGI server
+    app.run(host='127.0.0.1', port=5001, threaded=True)
@@ -2,147 +2,286 @@
 Improved Docker runner wrapper for sandboxed compilation.
 
 Behavior:
-- Uses `docker create` to create a container from the given image, mounts input-dir into /workspace
-- Starts the container, waits up to `--timeout` seconds for it to finish (via `docker wait`)
-- If timeout reached, kills and removes the container
-- Always collects `docker logs` stdout/stderr and returns a JSON object read from /workspace/output.json (if present)
+- Runs the given image once with `docker run --rm`, mounting input-dir into /workspace
+- Waits up to `--timeout` seconds for it to finish; on timeout the container is killed by name
+- Returns the container's stdout/stderr along with the JSON object read from /workspace/output.json (if present)
 - Adds optional seccomp support via SANDBOX_SECCOMP env var or --seccomp argument
 
 Usage:
   python3 docker_runner.py --input-dir /tmp/work --image graph-compiler-sandbox --timeout 15
 
 Output: JSON string printed to stdout
+
+run() (importable) does the same in-process and returns the result dict. run_stdio() instead pipes
+the job through the container's stdin/stdout with no host directory. SandboxPool (importable) keeps pre-started sandbox containers and runs each job with `docker exec`, for long-running
+callers such as compile_service.py.
 """
 import argparse
 import subprocess
-import json
 import os
+import queue
 import sys
 import tempfile
-import time
+import threading
+import uuid
 from pathlib import Path
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--input-dir', required=True)
-parser.add_argument('--image', required=True)
-parser.add_argument('--timeout', type=int, default=15)
-parser.add_argument('--memory', default=os.environ.get('SANDBOX_MEMORY', '256m'))
-parser.add_argument('--cpus', default=os.environ.get('SANDBOX_CPUS', '0.5'))
-parser.add_argument('--pids-limit', type=int, default=int(os.environ.get('SANDBOX_PIDS_LIMIT', '64')))
-parser.add_argument('--seccomp', default=os.environ.get('SANDBOX_SECCOMP'))
-args = parser.parse_args()
-
-input_dir = os.path.abspath(args.input_dir)
-image = args.image
-timeout = args.timeout
-
-# Build docker create command with safer defaults
-create_cmd = [
-    'docker', 'create',
-    '--network', 'none',
-    '--cap-drop', 'ALL',
-    '--security-opt', 'no-new-privileges',
-    '--read-only',
-    '--pids-limit', str(args.pids_limit),
-    '--memory', args.memory,
-    '--cpus', args.cpus,
-    # mount workspace as a writable bind even with read-only rootfs
-    '-v', f'{input_dir}:/workspace:rw',
-    # provide a small tmpfs for /tmp inside the container
-    '--tmpfs', '/tmp:rw',
-]
-if args.seccomp:
-    create_cmd += ['--security-opt', f'seccomp={args.seccomp}']
-create_cmd.append(image)
-
-# Create container
-try:
-    proc = subprocess.run(create_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=10)
-except subprocess.TimeoutExpired:
-    print(json.dumps({ 'success': False, 'error': 'create_timeout', 'message': 'docker create timed out' }))
-    sys.exit(0)
-
-if proc.returncode != 0:
-    print(json.dumps({ 'success': False, 'error': 'create_failed', 'message': proc.stderr or proc.stdout }))
-    sys.exit(0)
-
-container_id = proc.stdout.strip()
-if not container_id:
-    print(json.dumps({ 'success': False, 'error': 'no_container_id', 'message': 'docker create did not return a container id' }))
-    sys.exit(0)
-
-# Start container
-start_cmd = ['docker', 'start', container_id]
-proc = subprocess.run(start_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-if proc.returncode != 0:
-    # try to remove container
-    subprocess.run(['docker', 'rm', '-f', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    print(json.dumps({ 'success': False, 'error': 'start_failed', 'message': proc.stderr or proc.stdout }))
-    sys.exit(0)
-
-# Wait for container with docker wait and timeout handling
-finished = False
-exit_code = None
-start_time = time.time()
-try:
-    wait_proc = subprocess.Popen(['docker', 'wait', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    try:
-        out, err = wait_proc.communicate(timeout=timeout)
-        if wait_proc.returncode == 0:
-            exit_code = int(out.strip()) if out and out.strip().isdigit() else 0
-            finished = True
-    except subprocess.TimeoutExpired:
-        # Timeout: kill the container
-        subprocess.run(['docker', 'kill', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        # ensure wait_proc finishes
+from jsonio import json_bytes, jloads, jload
+
+SANDBOX_ENTRYPOINT = '/usr/local/bin/compile_in_container.py'
+
+
+class SandboxPool:
+    """Pre-started sandbox containers that each run one compile job at a time via `docker exec`.
+
+    Containers run `sleep infinity` with the same hardening flags as the per-job path and a tmpfs
+    /workspace. Jobs are piped through exec's stdin/stdout (SANDBOX_STDIO=1), so nothing is copied
+    in or out of the container. Jobs come from different clients, so after every job all processes
+    the job left behind are killed and /workspace and /tmp are wiped before the container is idle
+    again; a container is replaced instead if that scrub fails, if the job failed or timed out, or
+    after `recycle_after` jobs. Scrubbing and respawning happen on a background thread so the
+    request that used the container does not wait for them. run() returns None when no container
+    is idle so the caller can fall back to a fresh container.
+    """
+
+    def __init__(self, image, size, memory='256m', cpus='0.5', pids_limit=64, seccomp=None, recycle_after=50):
+        self.image = image
+        self.memory = memory
+        self.cpus = cpus
+        self.pids_limit = pids_limit
+        self.seccomp = seccomp
+        self.recycle_after = recycle_after
+        self._idle = queue.Queue()
+        self._jobs = {}  # container id -> jobs run
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            cid = self._spawn()
+            if cid:
+                self._idle.put(cid)
+
+    def _spawn(self):
+        cmd = [
+            'docker', 'run', '-d',
+            '--network', 'none',
+            '--cap-drop', 'ALL',
+            '--security-opt', 'no-new-privileges',
+            '--read-only',
+            '--pids-limit', str(self.pids_limit),
+            '--memory', self.memory,
+            '--cpus', self.cpus,
+            '--tmpfs', '/workspace:rw,exec,mode=1777',
+            '--tmpfs', '/tmp:rw',
+        ]
+        if self.seccomp:
+            cmd += ['--security-opt', f'seccomp={self.seccomp}']
+        cmd += ['--entrypoint', 'sleep', self.image, 'infinity']
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        cid = proc.stdout.strip()
+        if proc.returncode != 0 or not cid:
+            return None
+        with self._lock:
+            if not self._closed:
+                self._jobs[cid] = 0
+                return cid
+        # close() ran while this replacement was starting
+        subprocess.run(['docker', 'rm', '-f', cid], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return None
+
+    def _discard(self, cid):
+        with self._lock:
+            self._jobs.pop(cid, None)
+        subprocess.run(['docker', 'rm', '-f', cid], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _scrub(self, cid):
+        # Everything in the container runs as the image's user, so `kill -9 -1` from a fresh shell
+        # reaches every process a job left behind (not the shell itself, and not the namespace's
+        # init, `sleep infinity`). Twice, to catch children forked while the first sweep ran.
+        # Then both tmpfs mounts are emptied, dotfiles included.
+        script = 'kill -9 -1 2>/dev/null; kill -9 -1 2>/dev/null; find /workspace /tmp -mindepth 1 -delete'
+        try:
+            proc = subprocess.run(['docker', 'exec', cid, 'sh', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return proc.returncode == 0
+
+    def _release(self, cid, healthy):
+        with self._lock:
+            self._jobs[cid] = self._jobs.get(cid, 0) + 1
+            worn_out = self._jobs[cid] >= self.recycle_after
+        if healthy and not worn_out and self._scrub(cid):
+            self._idle.put(cid)
+            return
+        self._discard(cid)
+        fresh = self._spawn()
+        if fresh:
+            self._idle.put(fresh)
+
+    def _release_async(self, cid, healthy):
+        threading.Thread(target=self._release, args=(cid, healthy), daemon=True).start()
+
+    def run(self, payload, timeout=15, wait=None):
+        """Run the job (a dict) on an idle container; None if none is idle (after waiting up to
+        `wait` seconds for one, if given)."""
         try:
-            out, err = wait_proc.communicate(timeout=5)
-        except Exception:
-            pass
-        finished = False
-except Exception:
-    # As a fallback, poll container status
-    while time.time() - start_time < timeout:
-        ps = subprocess.run(['docker', 'inspect', '-f', '{{.State.Status}}', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        status = ps.stdout.strip()
-        if status in ('exited', 'dead'):
-            # get exit code
-            rc = subprocess.run(['docker', 'inspect', '-f', '{{.State.ExitCode}}', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            cid = self._idle.get(timeout=wait) if wait else self._idle.get_nowait()
+        except queue.Empty:
+            return None
+        healthy = False
+        try:
+            # ulimit bounds CPU time and timeout(1) wall time inside the container; killing the
+            # host-side docker exec client on timeout would not stop the job itself
+            job = f"ulimit -t {int(timeout)} && exec timeout -s KILL {int(timeout)} {SANDBOX_ENTRYPOINT}"
             try:
-                exit_code = int(rc.stdout.strip())
-            except Exception:
-                exit_code = 0
-            finished = True
-            break
-        time.sleep(0.2)
-    if not finished:
-        subprocess.run(['docker', 'kill', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        finished = False
-
-# Collect logs regardless
-logs_proc = subprocess.run(['docker', 'logs', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-container_stdout = logs_proc.stdout
-container_stderr = logs_proc.stderr
-
-# Attempt to read output.json from input_dir
-out_path = os.path.join(input_dir, 'output.json')
-result = None
-if os.path.exists(out_path):
+                proc = subprocess.run(['docker', 'exec', '-i', '-e', 'SANDBOX_STDIO=1', cid, 'sh', '-c', job], input=json_bytes(payload), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                return { 'success': False, 'error': 'timeout', 'message': 'Sandbox job timed out', '_finished': False, '_exit_code': None }
+            result = _parse_stdout(True, proc.returncode, proc.stdout.decode(errors='replace'), proc.stderr.decode(errors='replace'))
+            healthy = proc.returncode == 0
+            return result
+        except OSError as e:
+            return { 'success': False, 'error': 'pool_exec_failed', 'message': str(e) }
+        finally:
+            self._release_async(cid, healthy)
+
+    def idle_count(self):
+        """Number of containers currently idle (0 if none could be started)."""
+        return self._idle.qsize()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            cids = list(self._jobs)
+            self._jobs.clear()
+        if cids:
+            subprocess.run(['docker', 'rm', '-f', *cids], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def _run_cmd(name, workspace_args, image, memory, cpus, pids_limit, seccomp):
+    cmd = [
+        'docker', 'run', '--rm',
+        '--name', name,
+        '--network', 'none',
+        '--cap-drop', 'ALL',
+        '--security-opt', 'no-new-privileges',
+        '--read-only',
+        '--pids-limit', str(pids_limit),
+        '--memory', memory,
+        '--cpus', cpus,
+        *workspace_args,
+    ]
+    if seccomp:
+        cmd += ['--security-opt', f'seccomp={seccomp}']
+    cmd.append(image)
+    return cmd
+
+
+def _docker_run(cmd, name, timeout, input=None):
+    """Run cmd; returns (finished, exit_code, stdout, stderr). Raises OSError if docker can't be spawned."""
+    try:
+        proc = subprocess.run(cmd, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        # killing the client does not stop the container; --rm removes it once killed
+        subprocess.run(['docker', 'kill', name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return False, None, (e.stdout or b'').decode(errors='replace'), (e.stderr or b'').decode(errors='replace')
+    return True, proc.returncode, proc.stdout.decode(errors='replace'), proc.stderr.decode(errors='replace')
+
+
+def _finish(result, finished, exit_code, container_stdout, container_stderr):
+    # Attach metadata
+    if isinstance(result, dict):
+        result.setdefault('_container_stdout', container_stdout)
+        result.setdefault('_container_stderr', container_stderr)
+        result.setdefault('_finished', finished)
+        result.setdefault('_exit_code', exit_code)
+    return result
+
+
+def run(input_dir, image, timeout=15, memory='256m', cpus='0.5', pids_limit=64, seccomp=None):
+    """Run one sandbox job on the workspace in input_dir; returns the result dict (never raises
+    for docker failures, which are reported as {'success': False, 'error': ...})."""
+    input_dir = os.path.abspath(input_dir)
+
+    # One `docker run --rm` per job: exit code and logs come straight back from the client, and
+    # the daemon removes the container. The name lets a timed-out run be killed.
+    name = f'sb_{uuid.uuid4().hex}'
+    run_cmd = _run_cmd(name, [
+        # mount workspace as a writable bind even with read-only rootfs
+        '-v', f'{input_dir}:/workspace:rw',
+        # provide a small tmpfs for /tmp inside the container
+        '--tmpfs', '/tmp:rw',
+    ], image, memory, cpus, pids_limit, seccomp)
+    try:
+        finished, exit_code, container_stdout, container_stderr = _docker_run(run_cmd, name, timeout)
+    except OSError as e:
+        return { 'success': False, 'error': 'run_failed', 'message': str(e) }
+
+    # Attempt to read output.json from input_dir
+    out_path = os.path.join(input_dir, 'output.json')
+    result = None
+    if os.path.exists(out_path):
+        try:
+            result = jload(out_path)
+        except Exception as e:
+            result = { 'success': False, 'error': 'bad_output', 'message': 'Failed to parse output.json', 'exception': str(e), '_container_stdout': container_stdout, '_container_stderr': container_stderr }
+    elif exit_code == 125:
+        # 125 is the docker client's own failure (bad flags, missing image, daemon error)
+        result = { 'success': False, 'error': 'run_failed', 'message': container_stderr or container_stdout }
+    else:
+        result = { 'success': False, 'error': 'no_output', 'message': 'Container did not produce output.json', '_container_stdout': container_stdout, '_container_stderr': container_stderr }
+    return _finish(result, finished, exit_code, container_stdout, container_stderr)
+
+
+def _parse_stdout(finished, exit_code, container_stdout, container_stderr):
+    # result of a SANDBOX_STDIO=1 job: the entrypoint's stdout is the result JSON
+    if not container_stdout.strip():
+        if exit_code == 125:
+            return { 'success': False, 'error': 'run_failed', 'message': container_stderr }
+        if not finished:
+            return _finish({ 'success': False, 'error': 'timeout', 'message': 'Sandbox job timed out' }, finished, exit_code, '', container_stderr)
+        return _finish({ 'success': False, 'error': 'no_output', 'message': 'Container did not produce output' }, finished, exit_code, '', container_stderr)
+    try:
+        result = jloads(container_stdout)
+    except ValueError as e:
+        result = { 'success': False, 'error': 'bad_output', 'message': 'Failed to parse sandbox output', 'exception': str(e) }
+        return _finish(result, finished, exit_code, container_stdout, container_stderr)
+    # stdout is the result itself, so only stderr is attached
+    return _finish(result, finished, exit_code, '', container_stderr)
+
+
+def run_stdio(payload, image, timeout=15, memory='256m', cpus='0.5', pids_limit=64, seccomp=None):
+    """Like run(), but pipes the job (a dict) to the container's stdin and parses the result from
+    its stdout, so nothing is written on the host. The workspace is a tmpfs inside the container."""
+    name = f'sb_{uuid.uuid4().hex}'
+    run_cmd = _run_cmd(name, [
+        '-i',
+        '-e', 'SANDBOX_STDIO=1',
+        # the emitted binary runs from the workspace, so it needs exec
+        '--tmpfs', '/workspace:rw,exec,size=64m,mode=1777',
+        '--tmpfs', '/tmp:rw,size=64m',
+    ], image, memory, cpus, pids_limit, seccomp)
     try:
-        result = json.load(open(out_path))
-    except Exception as e:
-        result = { 'success': False, 'error': 'bad_output', 'message': 'Failed to parse output.json', 'exception': str(e), '_container_stdout': container_stdout, '_container_stderr': container_stderr }
-else:
-    result = { 'success': False, 'error': 'no_output', 'message': 'Container did not produce output.json', '_container_stdout': container_stdout, '_container_stderr': container_stderr }
-
-# Cleanup container
-subprocess.run(['docker', 'rm', '-f', container_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-# Attach metadata
-if isinstance(result, dict):
-    result.setdefault('_container_stdout', container_stdout)
-    result.setdefault('_container_stderr', container_stderr)
-    result.setdefault('_finished', finished)
-    result.setdefault('_exit_code', exit_code)
-
-print(json.dumps(result))
+        outcome = _docker_run(run_cmd, name, timeout, input=json_bytes(payload))
+    except OSError as e:
+        return { 'success': False, 'error': 'run_failed', 'message': str(e) }
+    return _parse_stdout(*outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-dir', required=True)
+    parser.add_argument('--image', required=True)
+    parser.add_argument('--timeout', type=int, default=15)
+    parser.add_argument('--memory', default=os.environ.get('SANDBOX_MEMORY', '256m'))
+    parser.add_argument('--cpus', default=os.environ.get('SANDBOX_CPUS', '0.5'))
+    parser.add_argument('--pids-limit', type=int, default=int(os.environ.get('SANDBOX_PIDS_LIMIT', '64')))
+    parser.add_argument('--seccomp', default=os.environ.get('SANDBOX_SECCOMP'))
+    args = parser.parse_args()
+    sys.stdout.buffer.write(json_bytes(run(**vars(args))) + b'\n')
+
+
+if __name__ == '__main__':
+    main()
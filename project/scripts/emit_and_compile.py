@@ -1,79 +1,86 @@
+import shutil
 import subprocess
 import sys
 import os
 from pathlib import Path
 import re
+import heapq
 from typing import Dict, Any
-import json
 
 # Import local modules
 sys.path.append(str(Path(__file__).resolve().parents[1] / 'compiler'))
 from cpp_emitter import CppEmitter
 from validator import topological_sort, validate_types, ValidationError
+import compile_cache
+from jsonio import jload, jdump
 
 # Default execution timeout (seconds) for running emitted binaries
 DEFAULT_EXEC_TIMEOUT = int(os.environ.get('EXEC_TIMEOUT', '5'))
 
 
 def load_json(p):
-    with open(p) as f:
-        return json.load(f)
+    return jload(p)
 
 
 def write_mapping(mapping, out_map_path):
-    with open(out_map_path, 'w') as f:
-        json.dump({'mappings': mapping}, f, indent=2)
+    jdump(out_map_path, {'mappings': mapping}, indent=True)
+
+
+# g++ error format: file:line:col: error: message
+# Also accept formats without column (file:line: error: message)
+_GPP_ERROR_RE = re.compile(r"(?m)^(?P<file>[^:\n]+):(?P<line>\d+)(?::(?P<col>\d+))?: (?P<kind>warning|error): (?P<msg>.*)$")
 
 
 def parse_gpp_errors(stderr_text):
-    # g++ error format: file:line:col: error: message
-    # Also accept formats without column (file:line: error: message)
-    pattern = re.compile(r"^(?P<file>[^:\\n]+):(?P<line>\d+)(?::(?P<col>\d+))?: (?P<kind>warning|error): (?P<msg>.*)$")
-    results = []
-    for line in stderr_text.splitlines():
-        m = pattern.match(line)
-        if m:
-            info = m.groupdict()
-            results.append({
-                'file': info.get('file'),
-                'line': int(info.get('line')),
-                'col': int(info['col']) if info.get('col') and info['col'].isdigit() else None,
-                'kind': info.get('kind'),
-                'msg': info.get('msg').strip()
-            })
-    return results
+    # findall yields plain (file, line, col, kind, msg) tuples, avoiding a match object per diagnostic
+    return [
+        {'file': file, 'line': int(line), 'col': int(col) if col else None, 'kind': kind, 'msg': msg.strip()}
+        for file, line, col, kind, msg in _GPP_ERROR_RE.findall(stderr_text)
+    ]
+
+
+def _node_match(err, node):
+    if node is None:
+        return {'error': err, 'node_id': None, 'function': None, 'port': None}
+    return {'error': err, 'node_id': node['node_id'], 'function': node.get('function'), 'port': node.get('port')}
 
 
 def map_errors_to_nodes(errors, mapping, cpp_path):
-    mapped = []
     # mapping: list of {node_id, function?, start_line, end_line, start_col?, end_col?, port?}
-    for err in errors:
+    # Sweep: errors in line order against entries sorted by start_line. Entries are pushed onto a
+    # heap keyed by end_line once they start at or before the current line and popped once they
+    # end before it, so the heap holds exactly the entries whose range covers the line. Each
+    # entry is pushed and popped once; each error only looks at the entries covering its line.
+    entries = sorted((m['start_line'], i, m) for i, m in enumerate(mapping) if m.get('start_line') and m.get('end_line'))
+    order = sorted(range(len(errors)), key=lambda k: int(errors[k]['line']))
+    mapped = [None] * len(errors)
+    active = []  # (end_line, position, entry)
+    nxt = 0
+    for k in order:
+        err = errors[k]
         line = int(err['line'])
         col = err.get('col')
-        # prefer exact column matches when available
-        colMatches = []
-        if col is not None:
-            for m in mapping:
-                sline = m.get('start_line')
-                eline = m.get('end_line')
-                scol = m.get('start_col')
-                ecol = m.get('end_col')
-                if sline and eline and sline <= line <= eline and scol and ecol and scol <= col <= ecol:
-                    colMatches.append(m)
-        if colMatches:
-            # choose smallest range
-            colMatches.sort(key=lambda x: ((x.get('end_line',0)-x.get('start_line',0)), (x.get('end_col',0)-x.get('start_col',0))))
-            node = colMatches[0]
-            mapped.append({'error': err, 'node_id': node['node_id'], 'function': node.get('function'), 'port': node.get('port')})
-            continue
-        # fallback: prefer line-only matches and choose smallest line range
-        lineMatches = [m for m in mapping if m.get('start_line') and m.get('end_line') and m['start_line'] <= line <= m['end_line']]
-        if lineMatches:
-            lineMatches.sort(key=lambda x: (x['end_line'] - x['start_line']))
-            node = lineMatches[0]
-            mapped.append({'error': err, 'node_id': node['node_id'], 'function': node.get('function'), 'port': node.get('port')})
+        while nxt < len(entries) and entries[nxt][0] <= line:
+            _, i, m = entries[nxt]
+            heapq.heappush(active, (m['end_line'], i, m))
+            nxt += 1
+        while active and active[0][0] < line:
+            heapq.heappop(active)
+        # prefer exact column matches when available, else the smallest line range; ties go to
+        # the entry listed first in the mapping
+        best_col = best_line = None
+        for end, i, m in active:
+            span = end - m['start_line']
+            if best_line is None or (span, i) < best_line[:2]:
+                best_line = (span, i, m)
+            if col is not None and m.get('start_col') and m.get('end_col') and m['start_col'] <= col <= m['end_col']:
+                key = (span, m['end_col'] - m['start_col'], i)
+                if best_col is None or key < best_col[:3]:
+                    best_col = (*key, m)
+        if best_col is not None:
+            mapped[k] = _node_match(err, best_col[3])
         else:
-            mapped.append({'error': err, 'node_id': None, 'function': None, 'port': None})
+            mapped[k] = _node_match(err, best_line[2] if best_line else None)
     return mapped
 
 
@@ -84,26 +91,23 @@ def normalize_ir(ir: Dict[str, Any]) -> Dict[str, Any]:
     edges = ir.get('edges', []) or []
 
     if edges:
-        # populate node.inputs and outputs from edges
-        inputs_map = {nid: [] for nid in node_ids}
-        outputs_map = {nid: [] for nid in node_ids}
+        # populate node.inputs and outputs from edges; dicts act as insertion-ordered sets so
+        # dedup stays O(1) per edge and first-seen order is kept
+        inputs_map = {nid: {} for nid in node_ids}
+        outputs_map = {nid: {} for nid in node_ids}
         for e in edges:
             frm = e.get('from')
             to = e.get('to')
             if frm not in node_ids or to not in node_ids:
                 # skip invalid edges
                 continue
-            inputs_map.setdefault(to, [])
-            if frm not in inputs_map[to]:
-                inputs_map[to].append(frm)
-            outputs_map.setdefault(frm, [])
-            if to not in outputs_map[frm]:
-                outputs_map[frm].append(to)
+            inputs_map[to][frm] = None
+            outputs_map[frm][to] = None
         # write back to nodes
         for n in nodes:
             nid = n['id']
-            n['inputs'] = inputs_map.get(nid, [])
-            n['outputs'] = outputs_map.get(nid, [])
+            n['inputs'] = list(inputs_map[nid])
+            n['outputs'] = list(outputs_map[nid])
     else:
         # No edges[] provided: build edges from node.inputs/node.outputs if present
         edges = []
@@ -123,29 +127,26 @@ def normalize_ir(ir: Dict[str, Any]) -> Dict[str, Any]:
             uniq.append(e)
         ir['edges'] = uniq
         # Also ensure outputs populated
-        outputs_map = {nid: [] for nid in node_ids}
+        outputs_map = {nid: {} for nid in node_ids}
         for e in uniq:
-            frm = e['from']
-            to = e['to']
-            outputs_map.setdefault(frm, [])
-            if to not in outputs_map[frm]:
-                outputs_map[frm].append(to)
+            outputs_map[e['from']][e['to']] = None
         for n in nodes:
-            n['outputs'] = outputs_map.get(n['id'], [])
+            n['outputs'] = list(outputs_map[n['id']])
     return ir
 
 
 def emit_compile_run(ir_path, node_defs_path=None, out_bin='out_run'):
     ir = load_json(ir_path)
-    ir = normalize_ir(ir)
     node_defs = {}
     if node_defs_path and os.path.exists(node_defs_path):
         node_defs = load_json(node_defs_path)
+    ir = normalize_ir(ir)
+    # key on the normalized IR, since that is what gets emitted
+    cache_key = compile_cache.cache_key(ir, node_defs, compile_cache.GPP_FLAGS, pipeline='emit_and_compile')
 
     # write normalized IR for debugging
     out_norm = Path(ir_path).with_suffix('.normalized.json')
-    with open(out_norm, 'w') as f:
-        json.dump(ir, f, indent=2)
+    jdump(out_norm, ir, indent=True)
 
     # Validate
     nodes = ir.get('nodes', [])
@@ -157,47 +158,51 @@ def emit_compile_run(ir_path, node_defs_path=None, out_bin='out_run'):
         print('Validation failed:', e)
         return 2
 
-    emitter = CppEmitter(ir, node_defs)
-    cpp = emitter.emit()
-
     out_cpp = Path(ir_path).with_suffix('.cpp')
     map_path = out_cpp.with_suffix('.map.json')
+    cached = compile_cache.lookup(cache_key)
+    if cached:
+        cpp, mapping = cached['cpp'], cached['mapping']
+    else:
+        emitter = CppEmitter(ir, node_defs)
+        cpp = emitter.emit()
+        mapping = emitter.mapping
     with open(out_cpp, 'w') as f:
         f.write(cpp)
 
-    # write mapping
-    try:
-        mapping = emitter.mapping
-    except Exception:
-        mapping = []
+    # write mapping (from the cache too, so error mapping tooling keeps working on hits)
     write_mapping(mapping, map_path)
 
-    # Compile
-    cmd = ['g++', '-std=c++17', '-O2', '-o', out_bin, str(out_cpp)]
-    print('Compiling:', ' '.join(cmd))
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if proc.returncode != 0:
-        print('Compile error:\n', proc.stderr)
-        errors = parse_gpp_errors(proc.stderr)
-        mapped = map_errors_to_nodes(errors, mapping, str(out_cpp))
-        # output structured mapping to a JSON file for tooling
-        out_err_path = Path(ir_path).with_suffix('.errors.json')
-        with open(out_err_path, 'w') as f:
-            json.dump({'mapped_errors': mapped, 'raw_stderr': proc.stderr}, f, indent=2)
-        if mapped:
-            print('\nMapped errors:')
-            for m in mapped:
-                err = m['error']
-                node_id = m['node_id']
-                func = m['function']
-                port = m.get('port')
-                if node_id:
-                    col_info = f":{err['col']}" if err.get('col') else ''
-                    print(f"- {err['kind'].upper()} at {err['file']}:{err['line']}{col_info} -> node '{node_id}' (function={func}, port={port}): {err['msg']}")
-                else:
-                    col_info = f":{err['col']}" if err.get('col') else ''
-                    print(f"- {err['kind'].upper()} at {err['file']}:{err['line']}{col_info} -> [no node mapping]: {err['msg']}")
-        return 3
+    if cached:
+        print('Compile cache hit:', cache_key)
+        shutil.copy2(cached['bin'], out_bin)
+    else:
+        # Compile
+        cmd = compile_cache.gpp_command(out_bin, out_cpp)
+        print('Compiling:', ' '.join(cmd))
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=compile_cache.gpp_env())
+        if proc.returncode != 0:
+            print('Compile error:\n', proc.stderr)
+            errors = parse_gpp_errors(proc.stderr)
+            mapped = map_errors_to_nodes(errors, mapping, str(out_cpp))
+            # output structured mapping to a JSON file for tooling
+            out_err_path = Path(ir_path).with_suffix('.errors.json')
+            jdump(out_err_path, {'mapped_errors': mapped, 'raw_stderr': proc.stderr}, indent=True)
+            if mapped:
+                print('\nMapped errors:')
+                for m in mapped:
+                    err = m['error']
+                    node_id = m['node_id']
+                    func = m['function']
+                    port = m.get('port')
+                    if node_id:
+                        col_info = f":{err['col']}" if err.get('col') else ''
+                        print(f"- {err['kind'].upper()} at {err['file']}:{err['line']}{col_info} -> node '{node_id}' (function={func}, port={port}): {err['msg']}")
+                    else:
+                        col_info = f":{err['col']}" if err.get('col') else ''
+                        print(f"- {err['kind'].upper()} at {err['file']}:{err['line']}{col_info} -> [no node mapping]: {err['msg']}")
+            return 3
+        compile_cache.store(cache_key, cpp, out_bin, mapping)
 
     # Run
     try:
@@ -213,8 +218,7 @@ def emit_compile_run(ir_path, node_defs_path=None, out_bin='out_run'):
         # Write a structured error file
         out_err_path = Path(ir_path).with_suffix('.errors.json')
         msg = f"Execution timed out after {DEFAULT_EXEC_TIMEOUT} seconds"
-        with open(out_err_path, 'w') as f:
-            json.dump({'mapped_errors': [], 'raw_stderr': '', 'error': 'timeout', 'message': msg, 'mapping': mapping, 'cpp': str(out_cpp)}, f, indent=2)
+        jdump(out_err_path, {'mapped_errors': [], 'raw_stderr': '', 'error': 'timeout', 'message': msg, 'mapping': mapping, 'cpp': str(out_cpp)}, indent=True)
         print('Execution timed out')
         return 4
 
@@ -0,0 +1,131 @@
+"""
+Direct evaluator for tiny IRs, used by compile_service.py to answer small requests without g++
+or a sandbox.
+
+Covers top-level graphs made only of Literal, Add/Sub/Mul/Div and Print nodes, and reproduces
+what the emitted C++ program would print (doubles formatted like std::cout's default %g).
+run() returns None for anything it cannot reproduce exactly (functions, other node types,
+string arithmetic, division by zero, NaN, ...) so the caller falls back to a real compile.
+"""
+import math
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'compiler'))
+from validator import topological_sort, ValidationError
+
+BINOPS = {
+    'Add': lambda a, b: a + b,
+    'Sub': lambda a, b: a - b,
+    'Mul': lambda a, b: a * b,
+    'Div': lambda a, b: a / b,
+}
+INTERP_SUPPORTED = frozenset(('Literal', 'Print', *BINOPS))
+# integer literals beyond this don't convert to double the same way in every toolchain
+_MAX_EXACT_INT = 2 ** 53
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _input_ports(node_defs: Dict[str, Any], ntype: str) -> list:
+    return [p.get('name') for p in (node_defs.get(ntype) or {}).get('inputs') or ()]
+
+
+def _resolve(node: Dict[str, Any], port_names, by_port: Dict[str, Dict[str, str]], positional: Dict[str, list]) -> list:
+    # same precedence as CppEmitter._resolve_inputs: named port, then edge position, then node.inputs
+    nid = node['id']
+    ports = by_port.get(nid) or {}
+    pos = positional.get(nid) or ()
+    legacy = node.get('inputs') or ()
+    srcs = []
+    for idx, pname in enumerate(port_names):
+        src = ports.get(pname) if pname else None
+        if src is None:
+            if idx < len(pos):
+                src = pos[idx]
+            elif idx < len(legacy):
+                src = legacy[idx]
+        srcs.append(src)
+    return srcs
+
+
+def _literal(val):
+    if isinstance(val, str):
+        return val
+    if isinstance(val, bool) or not isinstance(val, (int, float)):
+        raise _Unsupported()
+    if isinstance(val, int) and abs(val) > _MAX_EXACT_INT:
+        raise _Unsupported()
+    if isinstance(val, float) and not math.isfinite(val):
+        raise _Unsupported()
+    return float(val)
+
+
+def _format(val) -> str:
+    if isinstance(val, str):
+        return val
+    if math.isnan(val):
+        # printed as nan or -nan depending on the sign bit and libc
+        raise _Unsupported()
+    return '%g' % val
+
+
+def supported(ir: Dict[str, Any]) -> bool:
+    """True when every node of the IR is a type run() can evaluate."""
+    if ir.get('functions'):
+        return False
+    return all(n.get('type') in INTERP_SUPPORTED for n in ir.get('nodes', []) or [])
+
+
+def run(ir: Dict[str, Any], node_defs: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Evaluate a validated IR and return its stdout, or None if it must be compiled instead."""
+    if not supported(ir):
+        return None
+    node_defs = node_defs or {}
+    nodes = ir.get('nodes', []) or []
+    edges = ir.get('edges', []) or []
+    by_port: Dict[str, Dict[str, str]] = {}
+    positional: Dict[str, list] = {}
+    for e in edges:
+        if e.get('toPort'):
+            by_port.setdefault(e.get('to'), {})[e['toPort']] = e.get('from')
+        else:
+            positional.setdefault(e.get('to'), []).append(e.get('from'))
+    print_ports = _input_ports(node_defs, 'Print')
+    print_port = print_ports[0] if print_ports else None
+
+    try:
+        ordered = topological_sort(nodes, edges)
+    except ValidationError:
+        return None
+    values: Dict[str, Any] = {}
+    out = []
+    try:
+        for n in ordered:
+            ntype = n['type']
+            if ntype == 'Literal':
+                values[n['id']] = _literal(n.get('properties', {}).get('value'))
+            elif ntype == 'Print':
+                src = _resolve(n, (print_port,), by_port, positional)[0]
+                if not src:
+                    continue
+                # a source without a value prints as "" in the emitted code
+                out.append(_format(values.get(src, '')) + '\n')
+            else:
+                ports = _input_ports(node_defs, ntype)
+                port_names = (ports[0], ports[1]) if len(ports) >= 2 else (None, None)
+                operands = []
+                for src in _resolve(n, port_names, by_port, positional):
+                    if src is None:
+                        operands.append(0.0)  # unconnected inputs are emitted as 0
+                    elif isinstance(values.get(src), float):
+                        operands.append(values[src])
+                    else:
+                        raise _Unsupported()
+                values[n['id']] = BINOPS[ntype](*operands)
+    except (_Unsupported, ZeroDivisionError):
+        return None
+    return ''.join(out)
@@ -0,0 +1,32 @@
+"""
+JSON helpers shared by the host-side scripts.
+
+orjson is used when it is installed and the stdlib json module otherwise; both produce the same
+documents. compile_in_container.py keeps its own copy because it ships alone in the sandbox image.
+"""
+import json
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used when orjson is not installed
+    orjson = None
+
+
+def json_bytes(obj, indent=False, sort_keys=False):
+    if orjson is not None:
+        option = (orjson.OPT_INDENT_2 if indent else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys).encode()
+
+
+def jloads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def jload(path):
+    return jloads(Path(path).read_bytes())
+
+
+def jdump(path, obj, indent=False):
+    Path(path).write_bytes(json_bytes(obj, indent=indent))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Serve compile_service's Flask app with a production WSGI server.
+
+Per-request work is mostly waiting on Docker, so a threaded server is enough; threads also
+avoid forking after compile_service has started its sandbox pool and batching threads.
+
+Usage:
+  python3 project/scripts/serve_compile_service.py
+
+Environment:
+- SERVICE_HOST / SERVICE_PORT: bind address (default 127.0.0.1:5001)
+- SERVICE_THREADS: worker threads (default 16)
+
+Uses waitress when installed (pip install waitress) and otherwise falls back to the threaded
+Flask dev server. Equivalent with gunicorn: gunicorn -w 1 -k gthread --threads 16 -b 127.0.0.1:5001 compile_service:app
+"""
+import os
+import sys
+
+from compile_service import app
+
+HOST = os.environ.get('SERVICE_HOST', '127.0.0.1')
+PORT = int(os.environ.get('SERVICE_PORT', '5001'))
+THREADS = int(os.environ.get('SERVICE_THREADS', '16'))
+
+
+def main():
+    try:
+        from waitress import serve
+    except ImportError:
+        print('waitress not installed; falling back to the Flask dev server', file=sys.stderr)
+        app.run(host=HOST, port=PORT, threaded=True)
+        return
+    serve(app, host=HOST, port=PORT, threads=THREADS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""IR editing helpers shared by the tests."""
+from typing import Any, Dict, List, Optional, Tuple
+
+EdgeKey = Tuple[str, str, Optional[str]]
+
+
+def _index_edges(edges: List[Dict[str, Any]]) -> Dict[EdgeKey, int]:
+    # (from, to, toPort) -> position in edges; the first edge wins on duplicates
+    index: Dict[EdgeKey, int] = {}
+    for i, e in enumerate(edges):
+        index.setdefault((e.get('from'), e.get('to'), e.get('toPort')), i)
+    return index
+
+
+def insert_cast_node(ir: Dict[str, Any], src: str, dst: str, to_port: str, target_type: str, cast_id: str = 'cast') -> str:
+    """Splice a Cast node into the src -> dst.to_port edge of ir (in place); returns the cast id.
+
+    The edge is replaced where it stood, so positional matching of the other edges is unchanged.
+    Raises KeyError if ir has no such edge.
+    """
+    edges = ir.setdefault('edges', [])
+    i = _index_edges(edges)[(src, dst, to_port)]
+    edges[i:i + 1] = [
+        {'from': src, 'to': cast_id, 'toPort': 'in'},
+        {'from': cast_id, 'to': dst, 'toPort': to_port},
+    ]
+    ir.setdefault('nodes', []).append({'id': cast_id, 'type': 'Cast', 'properties': {'targetType': target_type}})
+    return cast_id
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+COMPILER_DIR = Path(__file__).resolve().parents[1] / 'compiler'
+SCRIPTS_DIR = Path(__file__).resolve().parents[1] / 'scripts'
+NODE_DEFS_PATH = COMPILER_DIR / 'node_defs.json'
+
+# make compiler modules (and the scripts' jsonio helpers) importable once for every test module
+for _dir in (COMPILER_DIR, SCRIPTS_DIR):
+    if str(_dir) not in sys.path:
+        sys.path.insert(0, str(_dir))
+
+from jsonio import jload
+
+
+@pytest.fixture(scope='session')
+def node_defs():
+    # parsed once per session; validator and emitter only read it
+    return jload(NODE_DEFS_PATH)
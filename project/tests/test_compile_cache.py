@@ -0,0 +1,51 @@
+import copy
+import shutil
+
+import pytest
+
+import compile_cache
+import emit_and_compile
+from jsonio import jdump
+
+pytestmark = pytest.mark.skipif(shutil.which('g++') is None, reason='needs g++')
+
+# Sub's operands come from node.inputs, but the IR also has an (unrelated) edge, so
+# normalize_ir rewrites s.inputs from edges[] and emit_and_compile emits 0 - 0 for it
+IR = {
+    'nodes': [
+        {'id': 'a', 'type': 'Literal', 'properties': {'value': 7}},
+        {'id': 'b', 'type': 'Literal', 'properties': {'value': 2}},
+        {'id': 's', 'type': 'Sub', 'inputs': ['a', 'b']},
+        {'id': 'p', 'type': 'Print', 'inputs': ['s']},
+    ],
+    'edges': [{'from': 's', 'to': 'p'}],
+    'imports': [],
+}
+
+
+@pytest.mark.parametrize('service_first', [False, True])
+def test_pipelines_do_not_share_entries(service_first, tmp_path, monkeypatch):
+    pytest.importorskip('flask')
+    import compile_service
+
+    monkeypatch.setattr(compile_cache, 'CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(compile_cache, 'ENABLED', True)
+    monkeypatch.chdir(tmp_path)
+    ir_path = tmp_path / 'ir.json'
+    jdump(ir_path, IR)
+
+    def via_script():
+        assert emit_and_compile.emit_compile_run(str(ir_path), out_bin='out_bin') == 0
+        return ir_path.with_suffix('.cpp').read_text()
+
+    def via_service():
+        result = compile_service.compile_in_process(copy.deepcopy(IR), {}, skip_validation=True)
+        assert result['success'], result
+        return result['cpp']
+
+    if service_first:
+        service_cpp, script_cpp = via_service(), via_script()
+    else:
+        script_cpp, service_cpp = via_script(), via_service()
+    assert 'v_a - v_b' in service_cpp
+    assert '0 - 0' in script_cpp
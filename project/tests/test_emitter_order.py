@@ -0,0 +1,21 @@
+from cpp_emitter import CppEmitter
+
+
+def _function(name, nodes):
+    return {'name': name, 'params': [], 'returnType': 'number', 'graph': {'nodes': nodes, 'edges': [], 'return': 'x'}}
+
+
+def test_functions_reusing_node_ids_are_ordered_independently():
+    # same node ids in both bodies, but the dependency runs the other way; with no edges the
+    # order comes from each node's inputs
+    f1 = _function('f1', [
+        {'id': 's', 'type': 'Add', 'inputs': ['x', 'x']},
+        {'id': 'x', 'type': 'Literal', 'properties': {'value': 5}},
+    ])
+    f2 = _function('f2', [
+        {'id': 's', 'type': 'Literal', 'properties': {'value': 5}},
+        {'id': 'x', 'type': 'Add', 'inputs': ['s', 's']},
+    ])
+    cpp = CppEmitter({'nodes': [], 'edges': [], 'imports': [], 'functions': [f1, f2]}, {}).emit()
+    f2_body = cpp[cpp.index('double f2()'):]
+    assert f2_body.index('double v_s = 5;') < f2_body.index('double v_x = v_s + v_s;'), cpp
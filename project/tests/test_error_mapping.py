@@ -0,0 +1,111 @@
+import random
+
+from emit_and_compile import map_errors_to_nodes, parse_gpp_errors
+
+
+def _entry(node_id, start_line, end_line, start_col=None, end_col=None, **extra):
+    m = {'node_id': node_id, 'start_line': start_line, 'end_line': end_line, **extra}
+    if start_col is not None:
+        m.update(start_col=start_col, end_col=end_col)
+    return m
+
+
+def _err(line, col=None):
+    return {'file': 'out.cpp', 'line': line, 'col': col, 'kind': 'error', 'msg': 'x'}
+
+
+def _ids(errors, mapping):
+    return [m['node_id'] for m in map_errors_to_nodes(errors, mapping, 'out.cpp')]
+
+
+def test_parse_gpp_errors():
+    stderr = (
+        "/tmp/run_main/nodes.cpp: In function 'int main()':\n"
+        "/tmp/run_main/nodes.cpp:12:9: error: 'v_x' was not declared in this scope\n"
+        "/tmp/run_main/nodes.cpp:12:9: note: suggested alternative: 'v_s'\n"
+        "notes.cpp:4: warning: unused variable  \n"
+    )
+    assert parse_gpp_errors(stderr) == [
+        # a path containing 'n' (the file name class once excluded it)
+        {'file': '/tmp/run_main/nodes.cpp', 'line': 12, 'col': 9, 'kind': 'error', 'msg': "'v_x' was not declared in this scope"},
+        {'file': 'notes.cpp', 'line': 4, 'col': None, 'kind': 'warning', 'msg': 'unused variable'},
+    ]
+
+
+def test_column_match_beats_narrower_line_match():
+    mapping = [
+        _entry('line_only', 5, 5),
+        _entry('wide', 4, 6, start_col=1, end_col=40),
+    ]
+    assert _ids([_err(5, 10)], mapping) == ['wide']
+    # outside every column range (or no column at all): smallest line range wins
+    assert _ids([_err(5, 50), _err(5)], mapping) == ['line_only', 'line_only']
+
+
+def test_column_match_tie_breaks():
+    mapping = [
+        _entry('multi_line', 3, 4, start_col=1, end_col=5),
+        _entry('wide', 3, 3, start_col=1, end_col=20),
+        _entry('narrow_b', 3, 3, start_col=8, end_col=12),
+        _entry('narrow_a', 3, 3, start_col=6, end_col=10),
+    ]
+    # smallest line span, then smallest column span, then mapping order
+    assert _ids([_err(3, 9)], mapping) == ['narrow_b']
+    assert _ids([_err(3, 15)], mapping) == ['wide']
+    assert _ids([_err(4, 2)], mapping) == ['multi_line']
+
+
+def test_line_match_tie_goes_to_first_entry():
+    mapping = [_entry('first', 2, 3), _entry('second', 2, 3), _entry('outer', 1, 9)]
+    assert _ids([_err(3)], mapping) == ['first']
+    assert _ids([_err(8)], mapping) == ['outer']
+
+
+def test_entries_without_positions_are_skipped():
+    mapping = [
+        {'node_id': 'no_lines'},
+        {'node_id': 'no_start', 'end_line': 2},
+        _entry('no_cols', 2, 2),
+        {'node_id': 'cols_without_start', 'start_line': 2, 'end_line': 2, 'end_col': 9},
+    ]
+    # no_cols and cols_without_start only match on line; mapping order breaks the tie
+    assert _ids([_err(2, 3), _err(1), _err(7)], mapping) == ['no_cols', None, None]
+
+
+def test_results_follow_error_order():
+    mapping = [_entry('a', 1, 1), _entry('b', 5, 5), _entry('c', 9, 9, function='f', port='value')]
+    result = map_errors_to_nodes([_err(9), _err(1), _err(5)], mapping, 'out.cpp')
+    assert [m['node_id'] for m in result] == ['c', 'a', 'b']
+    assert (result[0]['function'], result[0]['port']) == ('f', 'value')
+    assert result[0]['error'] == _err(9)
+
+
+def _reference_map(errors, mapping):
+    # straightforward scan over every entry for every error
+    ids = []
+    for err in errors:
+        line, col = err['line'], err.get('col')
+        lines = [(m['end_line'] - m['start_line'], i, m) for i, m in enumerate(mapping)
+                 if m.get('start_line') and m.get('end_line') and m['start_line'] <= line <= m['end_line']]
+        cols = [(span, m['end_col'] - m['start_col'], i, m) for span, i, m in lines
+                if col is not None and m.get('start_col') and m.get('end_col') and m['start_col'] <= col <= m['end_col']]
+        best = min(cols)[-1] if cols else (min(lines)[-1] if lines else None)
+        ids.append(best['node_id'] if best else None)
+    return ids
+
+
+def test_matches_reference_scan_on_random_mappings():
+    rng = random.Random(1234)
+    for _ in range(300):
+        mapping = []
+        for i in range(rng.randint(0, 12)):
+            start = rng.randint(1, 15)
+            entry = _entry(f'n{i}', start, start + rng.choice((0, 0, 1, 3)))
+            if rng.random() < 0.6:
+                scol = rng.randint(1, 20)
+                entry.update(start_col=scol, end_col=scol + rng.randint(0, 8))
+            if rng.random() < 0.1:
+                del entry['start_line']
+            mapping.append(entry)
+        errors = [_err(rng.randint(1, 20), rng.choice((None, rng.randint(1, 30)))) for _ in range(rng.randint(0, 8))]
+        assert _ids(errors, mapping) == _reference_map(errors, mapping), (errors, mapping)
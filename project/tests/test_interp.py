@@ -0,0 +1,61 @@
+import pytest
+
+import interp
+
+
+def _lit(nid, value):
+    return {'id': nid, 'type': 'Literal', 'properties': {'value': value}}
+
+
+def _op(nid, ntype, *inputs):
+    return {'id': nid, 'type': ntype, 'inputs': list(inputs)}
+
+
+def _ir(*nodes, edges=()):
+    return {'nodes': list(nodes), 'edges': list(edges), 'imports': []}
+
+
+# expected text is what the emitted program prints through std::cout
+@pytest.mark.parametrize('ir, expected', [
+    (_ir(_lit('l', 1234567), _op('p', 'Print', 'l')), '1.23457e+06\n'),
+    (_ir(_lit('a', 7), _lit('b', 2), _op('d', 'Div', 'a', 'b'), _op('p', 'Print', 'd')), '3.5\n'),
+    (_ir(_lit('a', 0.1), _lit('b', 0.2), _op('s', 'Add', 'a', 'b'), _op('p', 'Print', 's')), '0.3\n'),
+    (_ir(_lit('a', 2), _lit('b', 5), _op('s', 'Sub', 'a', 'b'), _op('p', 'Print', 's')), '-3\n'),
+    (_ir(_lit('a', 1e-5), _lit('b', 3), _op('m', 'Mul', 'a', 'b'), _op('p', 'Print', 'm')), '3e-05\n'),
+    (_ir(_lit('a', 0), _lit('b', -1), _op('m', 'Mul', 'a', 'b'), _op('p', 'Print', 'm')), '-0\n'),
+    (_ir(_lit('s', 'hi "there"\\n'), _op('p', 'Print', 's')), 'hi "there"\\n\n'),
+    (_ir(_lit('a', 1), _lit('b', 2), _op('p', 'Print', 'a'), _op('q', 'Print', 'b')), '1\n2\n'),
+])
+def test_run_matches_emitted_program(ir, expected, node_defs):
+    assert interp.run(ir, node_defs) == expected
+
+
+def test_unconnected_operand_is_zero(node_defs):
+    # only port b is wired; the emitter writes 0 for a
+    ir = _ir(_lit('l', 5), {'id': 's', 'type': 'Sub'}, _op('p', 'Print', 's'),
+             edges=[{'from': 'l', 'to': 's', 'toPort': 'b'}, {'from': 's', 'to': 'p', 'toPort': 'value'}])
+    assert interp.run(ir, node_defs) == '-5\n'
+
+
+@pytest.mark.parametrize('ir', [
+    _ir(_lit('a', 1), _lit('b', 0), _op('d', 'Div', 'a', 'b'), _op('p', 'Print', 'd')),
+    _ir(_lit('t', True), _op('p', 'Print', 't')),
+    _ir(_lit('a', 'x'), _lit('b', 1), _op('s', 'Add', 'a', 'b'), _op('p', 'Print', 's')),
+    dict(_ir(_lit('a', 1), _op('p', 'Print', 'a')), functions=[{'name': 'f', 'params': [], 'graph': {'nodes': []}}]),
+])
+def test_run_falls_back_to_compile(ir, node_defs):
+    assert interp.run(ir, node_defs) is None
+
+
+def test_interpret_respects_threshold(node_defs, monkeypatch):
+    pytest.importorskip('flask')
+    import compile_service
+
+    job = {'ir': _ir(_lit('a', 7), _lit('b', 2), _op('d', 'Div', 'a', 'b'), _op('p', 'Print', 'd')), 'node_defs': node_defs}
+    monkeypatch.setattr(compile_service, 'INTERP_THRESHOLD', 4)
+    result = compile_service._interpret(job)
+    assert result['interpreted'] and result['stdout'] == '3.5\n'
+    monkeypatch.setattr(compile_service, 'INTERP_THRESHOLD', 3)
+    assert compile_service._interpret(job) is None
+    monkeypatch.setattr(compile_service, 'INTERP_THRESHOLD', 0)
+    assert compile_service._interpret(job) is None
@@ -0,0 +1,87 @@
+import pytest
+
+from cpp_emitter import CppEmitter
+
+# the same literal wired into both operands of one node; the two port mappings must land on
+# the same emitted line with distinct column ranges
+
+# Add node with same literal connected to both inputs
+ADD_DUPLICATE_IR = {
+    'nodes': [
+        {'id': 'l1', 'type': 'Literal', 'properties': {'value': 7}},
+        {'id': 'add1', 'type': 'Add', 'inputs': ['l1', 'l1']},
+    ],
+    'edges': [],
+    'imports': []
+}
+
+# a literal passed twice to a Call node calling a function with two params
+CALL_DUPLICATE_IR = {
+    'nodes': [
+        {'id': 'l1', 'type': 'Literal', 'properties': {'value': 3}},
+        {'id': 'call1', 'type': 'Call', 'properties': {'name': 'dupFunc'}, 'inputs': ['l1', 'l1']},
+    ],
+    'edges': [],
+    'functions': [
+        {
+            'name': 'dupFunc',
+            'params': [{'name': 'a', 'type': 'number'}, {'name': 'b', 'type': 'number'}],
+            'returnType': 'number',
+            'graph': {'nodes': [], 'edges': []}
+        }
+    ],
+    'imports': []
+}
+
+# a function 'add' built from Param nodes and a Call node that passes the same literal twice
+CALL_GRAPH_IR = {
+    'nodes': [
+        {'id': 'l1', 'type': 'Literal', 'properties': {'value': 3}},
+        {'id': 'call1', 'type': 'Call', 'inputs': ['l1', 'l1'], 'properties': {'function': 'add'}},
+    ],
+    'edges': [],
+    'functions': [
+        {
+            'name': 'add',
+            'graph': {
+                'nodes': [
+                    {'id': 'p1', 'type': 'Param', 'properties': {'name': 'a'}},
+                    {'id': 'p2', 'type': 'Param', 'properties': {'name': 'b'}},
+                    {'id': 'add_local', 'type': 'Add', 'inputs': ['p1', 'p2']},
+                    {'id': 'ret', 'type': 'Return', 'inputs': ['add_local']},
+                ],
+                'edges': []
+            }
+        }
+    ],
+    'imports': []
+}
+
+
+@pytest.fixture(scope='module', params=[
+    pytest.param((ADD_DUPLICATE_IR, 'add1'), id='add'),
+    pytest.param((CALL_DUPLICATE_IR, 'call1'), id='call-params'),
+    pytest.param((CALL_GRAPH_IR, 'call1'), id='call-graph'),
+])
+def dup_emitter(request):
+    # each IR is emitted once per module and shared by every test that asserts on it
+    ir, node_id = request.param
+    emitter = CppEmitter(ir, {})
+    emitter.emit()
+    return emitter, node_id
+
+
+def test_duplicate_operand_columns(dup_emitter):
+    emitter, node_id = dup_emitter
+
+    # at least two port mappings for the node, all on one line, with distinct column ranges;
+    # the entries are gathered once and checked in a single assert
+    port_entries = emitter.mapping_by_node.get(node_id, [])
+    lines = {(p['start_line'], p['end_line']) for p in port_entries}
+    cols = sorted((p.get('start_col'), p.get('end_col')) for p in port_entries)
+    assert len(port_entries) >= 2 and len(lines) == 1 and cols[0] != cols[1], \
+        f"Expected 2+ port mappings for {node_id} on one line with distinct columns, got lines={lines} cols={cols}: {emitter.mapping}"
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
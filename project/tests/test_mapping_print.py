@@ -1,9 +1,3 @@
-import pytest
-from pathlib import Path
-import sys
-
-sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'compiler'))
-
 from cpp_emitter import CppEmitter
 
 
@@ -28,8 +22,8 @@ def test_print_node_duplicate_operand_columns():
     cpp = emitter.emit()
 
     # mapping should contain entries for p1 and p2
-    p1_entries = [m for m in emitter.mapping if m.get('node_id') == 'p1']
-    p2_entries = [m for m in emitter.mapping if m.get('node_id') == 'p2']
+    p1_entries = emitter.mapping_by_node.get('p1', [])
+    p2_entries = emitter.mapping_by_node.get('p2', [])
     assert len(p1_entries) >= 1, f"Expected mapping entries for p1, got: {emitter.mapping}"
     assert len(p2_entries) >= 1, f"Expected mapping entries for p2, got: {emitter.mapping}"
 
@@ -37,10 +31,11 @@ def test_print_node_duplicate_operand_columns():
     line_pairs = set((e['start_line'], e['end_line']) for e in p1_entries + p2_entries)
     # If p1 and p2 share a line, check column ranges differ
     combined = p1_entries + p2_entries
-    if any((p1_entries[0]['start_line'] == p2_entries[0]['start_line'])):
+    if p1_entries[0]['start_line'] == p2_entries[0]['start_line']:
         cols = sorted((p.get('start_col'), p.get('end_col')) for p in combined)
         assert cols[0] != cols[1], f"Expected distinct column ranges for duplicate Print operands, got: {cols}"
 
 
 if __name__ == '__main__':
-    pytest.main([str(Path(__file__))])
+    import pytest
+    pytest.main([__file__])
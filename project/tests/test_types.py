@@ -1,28 +1,21 @@
-import json
 from pathlib import Path
-import sys
-
-# Ensure compiler modules are importable
-sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'compiler'))
 
 from validator import validate_types, ValidationError
 from cpp_emitter import CppEmitter
-
-NODE_DEFS_PATH = Path(__file__).resolve().parents[1] / 'compiler' / 'node_defs.json'
-EXAMPLE_IR = Path(__file__).resolve().parents[1] / 'examples' / 'cast_example_ir.json'
+from _ir_helpers import insert_cast_node
+from jsonio import jload
 
 
-def load_node_defs():
-    return json.load(open(NODE_DEFS_PATH))
+EXAMPLE_IR = Path(__file__).resolve().parents[1] / 'examples' / 'cast_example_ir.json'
 
 
 def load_ir():
-    return json.load(open(EXAMPLE_IR))
+    # fresh copy per test: the cast test mutates it
+    return jload(EXAMPLE_IR)
 
 
-def test_validator_suggests_cast_for_string_to_number():
+def test_validator_suggests_cast_for_string_to_number(node_defs):
     ir = load_ir()
-    node_defs = load_node_defs()
     nodes = ir.get('nodes', [])
     edges = ir.get('edges', [])
     try:
@@ -34,24 +27,10 @@ def test_validator_suggests_cast_for_string_to_number():
         assert 'suggested_cast' in details or 'expected' in details, f"ValidationError details missing suggestion: {details}"
 
 
-def test_inserting_cast_node_allows_validation_and_emitter_records_mapping():
+def test_inserting_cast_node_allows_validation_and_emitter_records_mapping(node_defs):
     ir = load_ir()
-    node_defs = load_node_defs()
-    # find original edge from l_str -> add1
-    edges = ir.get('edges', [])
-    # remove that edge and insert Cast node between
-    new_edges = []
-    cast_id = 'cast_test'
-    for e in edges:
-        if e.get('from') == 'l_str' and e.get('to') == 'add1' and e.get('toPort') == 'a':
-            # replace with l_str -> cast_test (toPort in) and cast_test -> add1 (toPort a)
-            new_edges.append({'from': 'l_str', 'to': cast_id, 'toPort': 'in'})
-            new_edges.append({'from': cast_id, 'to': 'add1', 'toPort': 'a'})
-        else:
-            new_edges.append(e)
-    ir['edges'] = new_edges
-    # add Cast node
-    ir['nodes'].append({'id': cast_id, 'type': 'Cast', 'properties': {'targetType': 'number'}})
+    # replace the l_str -> add1.a edge with l_str -> cast_test.in -> add1.a
+    cast_id = insert_cast_node(ir, 'l_str', 'add1', 'a', 'number', cast_id='cast_test')
 
     # validation should pass now
     nodes = ir.get('nodes', [])
@@ -69,7 +48,5 @@ def test_inserting_cast_node_allows_validation_and_emitter_records_mapping():
 
 
 if __name__ == '__main__':
-    print('Running tests...')
-    test_validator_suggests_cast_for_string_to_number()
-    test_inserting_cast_node_allows_validation_and_emitter_records_mapping()
-    print('OK')
+    import pytest
+    pytest.main([__file__])
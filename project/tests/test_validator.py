@@ -1,22 +1,10 @@
-import json
 import pytest
-from pathlib import Path
-
-sys_path = Path(__file__).resolve().parents[1] / 'compiler'
-import sys
-sys.path.insert(0, str(sys_path))
 
 from validator import validate_types, ValidationError
 
 
-def load_node_defs():
-    ndp = Path(__file__).resolve().parents[1] / 'compiler' / 'node_defs.json'
-    return json.load(open(ndp))
-
-
-def test_invalid_toPort_raises_validation_error():
+def test_invalid_toPort_raises_validation_error(node_defs):
     # Build a small IR where an edge references a non-existing toPort on an Add node
-    node_defs = load_node_defs()
     nodes = [
         {"id": "l1", "type": "Literal", "properties": {"value": 1}},
         {"id": "add1", "type": "Add", "inputs": []}
@@ -29,9 +17,8 @@ def test_invalid_toPort_raises_validation_error():
     assert "has no input port named" in str(exc.value)
 
 
-def test_invalid_fromPort_raises_validation_error():
+def test_invalid_fromPort_raises_validation_error(node_defs):
     # Build nodes where fromPort refers to non-existing output on the source node
-    node_defs = load_node_defs()
     nodes = [
         {"id": "l1", "type": "Literal", "properties": {"value": 1}},
         {"id": "print1", "type": "Print", "inputs": []}
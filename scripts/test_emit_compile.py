@@ -1,53 +1,117 @@
 #!/usr/bin/env python3
 import sys
-import json
 import subprocess
 import os
+import hashlib
+import shutil
+from pathlib import Path
 
-if len(sys.argv) < 2:
-    print('Usage: python3 test_emit_compile.py <ir.json>')
+# Python validator/emitter, run in-process; --use-node runs the JS ones instead
+PY_COMPILER_DIR = Path(__file__).resolve().parents[1] / 'project' / 'compiler'
+PY_SCRIPTS_DIR = PY_COMPILER_DIR.parent / 'scripts'
+
+# --cache: reuse the binary from an earlier run when the emitted C++ (and toolchain) is unchanged
+CPP_CACHE_DIR = Path('.cache') / 'cppemit'
+GPP_FLAGS = ['-std=c++17', '-O2']
+
+args = sys.argv[1:]
+use_node = '--use-node' in args
+use_cache = '--cache' in args
+args = [a for a in args if a not in ('--use-node', '--cache')]
+if not args:
+    print('Usage: python3 test_emit_compile.py [--use-node] [--cache] <ir.json>')
     sys.exit(2)
 
-ir = sys.argv[1]
+ir = args[0]
 if not os.path.exists(ir):
     print('IR file not found:', ir)
     sys.exit(2)
 
-# run validator
-print('Running validator...')
-res = subprocess.run(['node','compiler/validator.js', ir], capture_output=True, text=True)
-print(res.stdout)
-if res.returncode != 0:
-    print('Validator failed:', res.stderr)
-    sys.exit(res.returncode)
-
-# emit C++
-print('Emitting C++...')
 out_cpp = 'out_test.cpp'
-with open(out_cpp, 'w') as f:
-    res = subprocess.run(['node','compiler/cpp_emitter.js', ir], capture_output=True, text=True)
+if use_node:
+    # run validator
+    print('Running validator...', flush=True)
+    # validator output goes straight to our stdout; stderr is only read back to explain a failure
+    res = subprocess.run(['node','compiler/validator.js', ir], stderr=subprocess.PIPE, check=False)
+    if res.returncode != 0:
+        print('Validator failed:', res.stderr.decode(errors='replace'))
+        sys.exit(res.returncode)
+
+    # emit C++
+    print('Emitting C++...')
+    # the emitter writes the C++ straight into out_cpp, with no round trip through Python strings
+    with open(out_cpp, 'wb') as f:
+        res = subprocess.run(['node','compiler/cpp_emitter.js', ir], stdout=f, stderr=subprocess.PIPE, check=False)
     if res.returncode != 0:
-        print('Emitter failed:', res.stderr)
+        print('Emitter failed:', res.stderr.decode(errors='replace'))
         sys.exit(res.returncode)
-    f.write(res.stdout)
+else:
+    sys.path += [str(PY_COMPILER_DIR), str(PY_SCRIPTS_DIR)]
+    from cpp_emitter import CppEmitter
+    from validator import topological_sort, validate_types, ValidationError
+    from jsonio import jload
 
-print('Generated C++:\n')
-print(open(out_cpp).read())
+    ir_dict = jload(ir)
+    node_defs = jload(PY_COMPILER_DIR / 'node_defs.json')
+
+    # run validator
+    print('Running validator...')
+    try:
+        nodes = ir_dict.get('nodes', [])
+        edges = ir_dict.get('edges', [])
+        topological_sort(nodes, edges)
+        validate_types(nodes, node_defs, edges)
+    except ValidationError as e:
+        print('Validator failed:', e)
+        sys.exit(1)
+
+    # emit C++
+    print('Emitting C++...')
+    try:
+        cpp = CppEmitter(ir_dict, node_defs).emit()
+    except Exception as e:
+        print('Emitter failed:', e)
+        sys.exit(1)
+    Path(out_cpp).write_text(cpp)
+
+print('Generated C++:\n', flush=True)
+with open(out_cpp, 'rb') as f:
+    shutil.copyfileobj(f, sys.stdout.buffer)
+sys.stdout.buffer.write(b'\n')
 
 # compile
-print('Compiling...')
 exe = 'out_test'
-res = subprocess.run(['g++', out_cpp, '-std=c++17', '-O2', '-o', exe], capture_output=True, text=True)
-if res.returncode != 0:
-    print('Compile failed:', res.stderr)
-    sys.exit(res.returncode)
+cached_exe = None
+if use_cache:
+    h = hashlib.sha256(Path(out_cpp).read_bytes())
+    h.update(' '.join(GPP_FLAGS).encode())
+    try:
+        h.update(subprocess.run(['g++', '--version'], stdout=subprocess.PIPE, check=False).stdout)
+    except OSError:
+        pass
+    cached_exe = CPP_CACHE_DIR / h.hexdigest()
+if cached_exe is not None and cached_exe.exists():
+    print('Compile cache hit:', cached_exe, flush=True)
+    shutil.copy2(cached_exe, exe)
+else:
+    print('Compiling...', flush=True)
+    # g++ diagnostics stream to the terminal as they are produced
+    res = subprocess.run(['g++', out_cpp, *GPP_FLAGS, '-o', exe], check=False)
+    if res.returncode != 0:
+        print('Compile failed (see g++ output above)')
+        sys.exit(res.returncode)
+    if cached_exe is not None:
+        CPP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # copy then rename so a concurrent run never picks up a half-written binary
+        tmp = cached_exe.with_suffix(f'.tmp{os.getpid()}')
+        shutil.copy2(exe, tmp)
+        os.replace(tmp, cached_exe)
 
 # run
-print('Running binary...')
-res = subprocess.run(['./' + exe], capture_output=True, text=True)
+print('Running binary...', flush=True)
+# the program's stdout/stderr are inherited rather than captured
+res = subprocess.run(['./' + exe], check=False)
 print('Exit code:', res.returncode)
-print('Stdout:\n', res.stdout)
-print('Stderr:\n', res.stderr)
 
 # success
 sys.exit(res.returncode)